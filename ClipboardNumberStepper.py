@@ -1,49 +1,61 @@
 # pip install pyperclip
+# 可选: pip install keyboard （--watch 模式下自动检测 Ctrl+V）
 # ClipboardNumberStepper.py
 # 这个脚本用于修改剪贴板中的数字，每次步进1，用户粘贴后继续步进，直到剪贴板中的数字达到用户指定的终点值时停止。
 # Custom Unicode字符保留原样。
 
 # 导入所需的库
-import pyperclip
+import argparse
 import re
+import sys
+import threading
+import time
+
+import pyperclip
+
+try:
+    import keyboard
+except ImportError:
+    # 没有 keyboard 时，--watch 模式用回车代替 Ctrl+V 检测
+    keyboard = None
+
+# 用于匹配数字的正则表达式，只编译一次
+NUMBER_PATTERN = re.compile(r'\d+')
+POLL_INTERVAL = 0.25  # 监视模式下检查剪贴板的间隔（秒）
+PASTE_DELAY = 0.2  # 检测到 Ctrl+V 后等目标程序读完剪贴板再改写（秒）
+GENERATE_BATCH = 65536  # 批量生成模式每次拼接写出的行数
+
+def step_numbers(text, target_value):
+    # 一次 re.sub 把所有数字步进1，每个数字都在原位置替换
+    # 返回 (新文本, 是否有数字达到终点值)，没有数字时新文本为 None
+    reached_target = False
+    found = False
+
+    def increment(match):
+        nonlocal reached_target, found
+        found = True
+        incremented_number = int(match.group()) + 1
+        if incremented_number == target_value:
+            reached_target = True
+        return str(incremented_number)
+
+    text = NUMBER_PATTERN.sub(increment, text)
+    return (text if found else None), reached_target
 
 # 定义一个函数来步进数字
 def increment_numbers_in_clipboard(target_value):
     while True:
-        # 获取剪贴板中的文本
-        text = pyperclip.paste()
-
-        # 定义一个用于匹配数字的正则表达式
-        number_pattern = re.compile(r'\d+')
-
-        # 使用正则表达式找到文本中的所有数字
-        numbers = number_pattern.findall(text)
+        # 获取剪贴板中的文本并步进
+        text, reached_target = step_numbers(pyperclip.paste(), target_value)
 
         # 如果没有找到数字，则返回
-        if not numbers:
+        if text is None:
             print("剪贴板中没有数字。")
             return
 
-        # 标志变量，用于检查是否有数字达到了终点值
-        reached_target = False
-
-        # 遍历所有找到的数字
-        for number in numbers:
-            # 将数字转换为整数并步进1
-            incremented_number = int(number) + 1
-
-            # 用步进后的数字替换原来的数字
-            text = text.replace(number, str(incremented_number), 1)
-
-            # 将修改后的文本重新写入剪贴板
-            pyperclip.copy(text)
-
-            # 打印当前剪贴板内容
-            print(f"当前剪贴板内容: {text}")
-
-            # 如果步进后的数字等于目标值，则停止
-            if incremented_number == target_value:
-                reached_target = True
+        # 每步只写一次剪贴板
+        pyperclip.copy(text)
+        print(f"当前剪贴板内容: {text}")
 
         # 如果已经达到了目标值，则退出循环
         if reached_target:
@@ -53,16 +65,190 @@ def increment_numbers_in_clipboard(target_value):
         # 提示用户进行粘贴操作并等待确认
         input("请按Ctrl+V进行粘贴，然后按回车键继续...")
 
+def parse_template(text):
+    # 把模板拆成文字片段和数字，只解析一次
+    # 返回 (文字片段列表, [(数值, 位数), ...])，文字片段比数字多一个
+    literals = []
+    numbers = []
+    last = 0
+    for match in NUMBER_PATTERN.finditer(text):
+        literals.append(text[last:match.start()])
+        numbers.append((int(match.group()), len(match.group())))
+        last = match.end()
+    literals.append(text[last:])
+    return literals, numbers
+
+def count_variants(numbers, steps, target_value):
+    # 和逐步模式一样，任意一个步进中的数字到达终点值就停止
+    counts = []
+    for (start, _), step in zip(numbers, steps):
+        if step > 0 and start <= target_value:
+            counts.append((target_value - start) // step + 1)
+        elif step < 0 and start >= target_value:
+            counts.append((start - target_value) // -step + 1)
+    return min(counts) if counts else 0
+
+def generate_variants(text, target_value, step=1, rules=None, keep_width=False, batch_size=GENERATE_BATCH):
+    # 批量生成模式：从模板本身开始，逐个步进到终点值，按批产出拼好的文本
+    # rules 是 {数字序号: 步长}，步长 0 表示这个数字保持不变
+    # keep_width 时按模板中的位数补零（如 007 -> 008）
+    literals, numbers = parse_template(text)
+    rules = rules or {}
+    for index in rules:
+        if not 0 <= index < len(numbers):
+            raise ValueError(f"规则中的数字序号 {index} 超出范围（模板中有 {len(numbers)} 个数字）")
+    steps = [rules.get(index, step) for index in range(len(numbers))]
+    count = count_variants(numbers, steps, target_value)
+
+    # 固定的数字直接写进格式串，步进的数字用 %d 占位，每行只做一次 % 格式化
+    parts = [literals[0].replace('%', '%%')]
+    columns = []
+    for (start, width), number_step, literal in zip(numbers, steps, literals[1:]):
+        if number_step == 0:
+            parts.append('%0*d' % (width, start) if keep_width else str(start))
+        else:
+            parts.append(f'%0{width}d' if keep_width else '%d')
+            columns.append((start, number_step))
+        parts.append(literal.replace('%', '%%'))
+    line_format = ''.join(parts)
+
+    for first in range(0, count, batch_size):
+        last = min(first + batch_size, count)
+        ranges = [range(start + first * number_step, start + last * number_step, number_step)
+                  for start, number_step in columns]
+        yield '\n'.join(map(line_format.__mod__, zip(*ranges))) + '\n'
+
+def parse_rule(rule):
+    # "序号=步长"，例如 1=0 表示第二个数字不变
+    index, _, step = rule.partition('=')
+    try:
+        return int(index), int(step)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"规则格式应为 序号=步长，例如 1=0，收到: {rule}")
+
+def start_paste_listener():
+    # 返回一个 Event，每次用户粘贴（或没有 keyboard 时按回车）都会被置位
+    pasted = threading.Event()
+    if keyboard is not None:
+        try:
+            keyboard.add_hotkey('ctrl+v', pasted.set)
+            return pasted, "Ctrl+V"
+        except Exception as e:  # Linux 上需要 root 权限
+            print(f"无法监听键盘 ({e})，改为按回车键确认粘贴。")
+
+    def read_enter():
+        while True:
+            try:
+                input()
+            except EOFError:
+                return
+            pasted.set()
+
+    threading.Thread(target=read_enter, daemon=True).start()
+    return pasted, "回车键"
+
+def wait_for_paste(pasted, current_text, interval=POLL_INTERVAL):
+    # 等待用户粘贴；期间轮询剪贴板，用户复制了新文本就返回新文本，粘贴了就返回 None
+    pasted.clear()
+    while not pasted.wait(interval):
+        text = pyperclip.paste()
+        if text != current_text:
+            return text
+    time.sleep(PASTE_DELAY)
+    return None
+
+def watch_clipboard(target_value, interval=POLL_INTERVAL):
+    # 监视模式：粘贴后自动步进，复制新文本后自动以它为新模板，不需要每步按回车
+    pasted, trigger = start_paste_listener()
+    print(f"监视剪贴板中（每次粘贴后自动步进，检测方式: {trigger}），按 Ctrl+C 退出。")
+    text = pyperclip.paste()
+    while True:
+        stepped, reached_target = step_numbers(text, target_value)
+        if stepped is None or reached_target:
+            if stepped is None:
+                print("剪贴板中没有数字，等待复制新的文本...")
+            else:
+                pyperclip.copy(stepped)
+                print(f"当前剪贴板内容: {stepped}")
+                print(f"数字已经变成{target_value}，停止步进。复制新的文本可以重新开始。")
+            text = wait_for_new_text(pyperclip.paste(), interval)
+            continue
+
+        pyperclip.copy(stepped)
+        print(f"当前剪贴板内容: {stepped}")
+        new_text = wait_for_paste(pasted, stepped, interval)
+        text = stepped if new_text is None else new_text
+
+def wait_for_new_text(current_text, interval=POLL_INTERVAL):
+    while True:
+        time.sleep(interval)
+        text = pyperclip.paste()
+        if text != current_text:
+            return text
+
 if __name__ == "__main__":
-    # 获取用户指定的终点值
-    target_value = int(input("请输入要步进到的终点值: "))
+    parser = argparse.ArgumentParser(description="步进剪贴板中的数字，直到达到终点值")
+    parser.add_argument("target_value", nargs='?', type=int, help="要步进到的终点值（不填则运行时输入）")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视模式：检测到粘贴后自动步进（安装 keyboard 可识别 Ctrl+V，否则按回车）")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="监视模式检查剪贴板的间隔（秒）")
+    parser.add_argument("--generate", action="store_true",
+                        help="批量生成模式：把模板的所有步进结果一次输出，每个结果一行")
+    parser.add_argument("--template-file", help="批量生成模式的模板文件（默认使用剪贴板）")
+    parser.add_argument("-o", "--output", help="批量生成模式的输出文件（默认输出到屏幕）")
+    parser.add_argument("--step", type=int, default=1, help="批量生成模式的步长（默认 1）")
+    parser.add_argument("--rule", type=parse_rule, action="append", default=[], metavar="序号=步长",
+                        help="单独指定第几个数字（从 0 开始）的步长，0 表示不变，可重复使用")
+    parser.add_argument("--keep-width", action="store_true", help="按模板中数字的位数补零，如 007 -> 008")
+    args = parser.parse_args()
 
-    while True:
-        # 每次运行脚本时等待用户确认
-        input("请将文本复制到剪贴板后按回车键继续...")
-        
-        # 调用函数处理剪贴板中的数字
-        increment_numbers_in_clipboard(target_value)
-
-        # 提示用户处理完成
-        print("处理完成。如果需要再次运行，请重新复制文本并按回车键。")
+    # 获取用户指定的终点值
+    target_value = args.target_value
+    if target_value is None:
+        if args.generate:
+            # 生成结果可能被重定向，提示写到 stderr，不混进输出
+            print("请输入要步进到的终点值: ", end='', file=sys.stderr, flush=True)
+            target_value = int(input())
+        else:
+            target_value = int(input("请输入要步进到的终点值: "))
+
+    if args.generate:
+        if args.template_file:
+            with open(args.template_file, 'r', encoding='utf-8') as f:
+                template = f.read().rstrip('\n')
+        else:
+            template = pyperclip.paste()
+        start = time.perf_counter()
+        lines_per_variant = template.count('\n') + 1
+        variant_count = 0
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for chunk in generate_variants(template, target_value, args.step, dict(args.rule), args.keep_width):
+                output.write(chunk)
+                variant_count += chunk.count('\n') // lines_per_variant
+        except ValueError as e:
+            sys.exit(str(e))
+        finally:
+            if args.output:
+                output.close()
+        elapsed = time.perf_counter() - start
+        if variant_count == 0:
+            print("没有会到达终点值的数字，未生成任何内容。", file=sys.stderr)
+        else:
+            print(f"生成 {variant_count} 条，用时 {elapsed:.2f}s（{variant_count / (elapsed or 1e-9):,.0f} 条/秒）",
+                  file=sys.stderr)
+    elif args.watch:
+        try:
+            watch_clipboard(target_value, args.interval)
+        except KeyboardInterrupt:
+            print("\n已退出。")
+    else:
+        while True:
+            # 每次运行脚本时等待用户确认
+            input("请将文本复制到剪贴板后按回车键继续...")
+
+            # 调用函数处理剪贴板中的数字
+            increment_numbers_in_clipboard(target_value)
+
+            # 提示用户处理完成
+            print("处理完成。如果需要再次运行，请重新复制文本并按回车键。")
@@ -1,65 +1,189 @@
-import base64
-import gzip
+import hashlib
 import json
+import queue
+import threading
 import tkinter as tk
+from collections import OrderedDict
+from itertools import islice
 from tkinter import filedialog, messagebox, ttk
 import codecs
 
-GLAMOURER_VERSION_BYTE = b'\x06'
+from glamourer_codec import (FORMAT_COMPRESSED, FORMAT_GLAMOURER, FORMAT_UNCOMPRESSED, detect_and_decode,
+                             encode_all, remove_bom)
 
-def remove_bom(file_content):
-    return file_content.lstrip('\ufeff')
+DEBOUNCE_MS = 300  # wait for typing to pause before encoding
+POLL_MS = 50  # how often the Tk loop picks up finished work
+CACHE_SIZE = 8  # documents whose encodings are kept
+LARGE_DOCUMENT_SIZE = 2 * 1024 * 1024  # characters of JSON that switch on the large-document mode
+RENDER_CHUNK = 256 * 1024  # characters added to the text pane per scroll step in that mode
+TREE_GROUP = 100  # array items / object keys per tree node
 
-def glamourer_encode(data):
-    json_string = json.dumps(data)
-    compressed_data = gzip.compress(json_string.encode('utf-8'))
-    return base64.b64encode(GLAMOURER_VERSION_BYTE + compressed_data).decode('utf-8')
+# Codec work runs on one background thread. Every request carries a
+# generation number; work and results older than the newest request of
+# the same kind are dropped, so only the latest edit ever reaches the UI.
+requests = queue.Queue()
+results = queue.Queue()
+latest_generation = {'encode': 0, 'decode': 0}
+# sha256 of the JSON text, or ('document', version) -> {encoding type: encoded text}
+encode_cache = OrderedDict()
+pending_encode = None
 
-def standard_encode(data, compress=False):
-    json_string = json.dumps(data)
-    if compress:
-        compressed_data = gzip.compress(json_string.encode('utf-8'))
-        return base64.b64encode(compressed_data).decode('utf-8')
+# The parsed document is the source of truth and the text pane only shows
+# it. Once the user edits the text (dirty), the text is parsed instead.
+document = {'data': None, 'version': 0, 'dirty': True, 'large': False}
+renderer = None  # rest of the pretty-printed document, not yet in the text pane
+render_scheduled = False
+tree_nodes = {}  # tree item -> (container, start, stop) of children not inserted yet
+
+def codec_worker():
+    while True:
+        kind, generation, payload = requests.get()
+        if generation != latest_generation[kind]:
+            continue  # a newer request is already queued
+        try:
+            if kind == 'encode':
+                source, value, key = payload
+                data = json.loads(value) if source == 'text' else value
+                result = encode_all(data), data
+            else:
+                data, encoding_type = detect_and_decode(payload)
+                # Compact size decides the mode; small documents are also
+                # pretty-printed here, off the Tk thread
+                size = len(json.dumps(data))
+                text = json.dumps(data, indent=4) if size <= LARGE_DOCUMENT_SIZE else None
+                result = data, encoding_type, size, text
+            results.put((kind, generation, payload, result, None))
+        except Exception as e:
+            results.put((kind, generation, payload, None, e))
+
+def submit(kind, payload):
+    latest_generation[kind] += 1
+    requests.put((kind, latest_generation[kind], payload))
+
+def poll_results():
+    try:
+        while True:
+            kind, generation, payload, result, error = results.get_nowait()
+            if generation != latest_generation[kind]:
+                continue  # stale
+            if kind == 'encode':
+                source, _, key = payload
+                show_encoded(key, result and result[0], error)
+                if error is None and source == 'text':
+                    populate_tree(result[1])
+            else:
+                show_decoded(result, error)
+    except queue.Empty:
+        pass
+    finally:
+        # Keep polling even if showing a result failed
+        root.after(POLL_MS, poll_results)
+
+def set_document(data, size, text=None):
+    # Show a parsed document; big ones are rendered lazily and read-only.
+    # text is the pretty-printed document if the caller already has it.
+    global renderer
+    document.update(data=data, dirty=False, large=size > LARGE_DOCUMENT_SIZE)
+    document['version'] += 1
+    json_text.configure(state=tk.NORMAL)
+    json_text.delete('1.0', tk.END)
+    if document['large']:
+        renderer = json.JSONEncoder(indent=4).iterencode(data)
+        render_more()
+    else:
+        renderer = None
+        json_text.insert(tk.END, text if text is not None else json.dumps(data, indent=4))
+    json_text.edit_modified(False)
+    populate_tree(data)
+
+def set_json_text(text):
+    # Plain text in the JSON pane (error messages); it becomes the source
+    global renderer
+    renderer = None
+    document.update(dirty=True, large=False)
+    json_text.configure(state=tk.NORMAL)
+    json_text.delete('1.0', tk.END)
+    json_text.insert(tk.END, text)
+    json_text.edit_modified(False)
+
+def render_more():
+    global renderer, render_scheduled
+    render_scheduled = False
+    if renderer is None:
+        return
+    pieces = []
+    size = 0
+    for piece in renderer:
+        pieces.append(piece)
+        size += len(piece)
+        if size >= RENDER_CHUNK:
+            break
     else:
-        return base64.b64encode(json_string.encode('utf-8')).decode('utf-8')
-
-def glamourer_decode(base64_data):
-    decoded_data = base64.b64decode(base64_data)
-    if decoded_data[0:1] != GLAMOURER_VERSION_BYTE:
-        raise ValueError("Invalid Glamourer version byte")
-    decompressed_data = gzip.decompress(decoded_data[1:]).decode('utf-8')
-    return json.loads(decompressed_data)
-
-def standard_decode(base64_data, compressed=False):
-    decoded_data = base64.b64decode(base64_data)
-    if compressed:
-        decompressed_data = gzip.decompress(decoded_data).decode('utf-8')
+        renderer = None
+    json_text.configure(state=tk.NORMAL)
+    json_text.insert(tk.END, ''.join(pieces))
+    json_text.configure(state=tk.DISABLED)
+    json_text.edit_modified(False)  # appending a chunk is not an edit
+
+def on_json_scroll(first, last):
+    # Append the next chunk when the view gets near the end of what is rendered
+    global render_scheduled
+    if renderer is not None and not render_scheduled and float(last) > 0.9:
+        render_scheduled = True
+        root.after_idle(render_more)
+
+def on_json_edit(*args):
+    if document['large']:
+        return  # read-only and only partly rendered, never the encode source
+    if json_text.edit_modified():
+        json_text.edit_modified(False)
+        document['dirty'] = True
+        schedule_encode()
+
+def populate_tree(data):
+    tree_nodes.clear()
+    json_tree.delete(*json_tree.get_children())
+    if isinstance(data, (dict, list)):
+        add_tree_children('', data, 0, len(data))
     else:
-        decompressed_data = decoded_data.decode('utf-8')
-    return json.loads(decompressed_data)
+        add_tree_node('', 'value', data)
 
-def is_glamourer_encoded(base64_data):
-    try:
-        decoded_data = base64.b64decode(base64_data)
-        return decoded_data[0:1] == GLAMOURER_VERSION_BYTE
-    except:
-        return False
+def add_tree_node(parent, label, value):
+    if isinstance(value, (dict, list)) and value:
+        summary = f"{{...}} {len(value)} keys" if isinstance(value, dict) else f"[...] {len(value)} items"
+        node = json_tree.insert(parent, tk.END, text=f"{label}: {summary}")
+        tree_nodes[node] = (value, 0, len(value))
+        json_tree.insert(node, tk.END, text='...')  # placeholder, so the node can be opened
+    else:
+        text = json.dumps(value, ensure_ascii=False)
+        if len(text) > 200:
+            text = text[:200] + '...'
+        json_tree.insert(parent, tk.END, text=f"{label}: {text}")
 
-def is_compressed(base64_data):
-    try:
-        decoded_data = base64.b64decode(base64_data)
-        gzip.decompress(decoded_data)
-        return True
-    except:
-        return False
-
-def decode_and_decompress(base64_data):
-    if is_glamourer_encoded(base64_data):
-        return glamourer_decode(base64_data)
-    elif is_compressed(base64_data):
-        return standard_decode(base64_data, compressed=True)
+def add_tree_children(parent, value, start, stop):
+    # More than TREE_GROUP children are split into ranges, opened on demand
+    group = 1
+    while stop - start > group * TREE_GROUP:
+        group *= TREE_GROUP
+    if group > 1:
+        for first in range(start, stop, group):
+            last = min(first + group, stop)
+            node = json_tree.insert(parent, tk.END, text=f"[{first} ... {last - 1}]")
+            tree_nodes[node] = (value, first, last)
+            json_tree.insert(node, tk.END, text='...')
+    elif isinstance(value, dict):
+        for key in islice(value, start, stop):
+            add_tree_node(parent, key, value[key])
     else:
-        return standard_decode(base64_data, compressed=False)
+        for index in range(start, stop):
+            add_tree_node(parent, f"[{index}]", value[index])
+
+def expand_tree_node(*args):
+    node = json_tree.focus()
+    if node in tree_nodes:
+        value, start, stop = tree_nodes.pop(node)
+        json_tree.delete(*json_tree.get_children(node))
+        add_tree_children(node, value, start, stop)
 
 def load_json_file():
     file_path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
@@ -71,11 +195,13 @@ def load_json_file():
                     raise ValueError("The file is empty.")
                 file_content = remove_bom(file_content)
                 data = json.loads(file_content)
-            
-            json_text.delete('1.0', tk.END)
-            json_text.insert(tk.END, json.dumps(data, indent=4))
+
+            set_document(data, len(file_content))
             encode_and_update()
-            encoding_status.set("JSON file loaded successfully")
+            if document['large']:
+                encoding_status.set("Large JSON file loaded (read-only, see the Tree tab)")
+            else:
+                encoding_status.set("JSON file loaded successfully")
         except json.JSONDecodeError as e:
             messagebox.showerror("JSON Error", f"Invalid JSON format: {str(e)}")
             encoding_status.set("Error: Invalid JSON format")
@@ -87,9 +213,11 @@ def load_json_file():
             encoding_status.set("Error: Failed to load file")
 
 def save_json_file():
-    json_data = json_text.get('1.0', tk.END).strip()
     try:
-        data = json.loads(json_data)
+        if document['dirty']:
+            data = json.loads(json_text.get('1.0', tk.END).strip())
+        else:
+            data = document['data']
         file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
         if file_path:
             with open(file_path, 'w') as f:
@@ -99,103 +227,138 @@ def save_json_file():
         messagebox.showerror("Error", f"An error occurred: {e}")
 
 def encode_and_update(*args):
-    json_data = json_text.get('1.0', tk.END).strip()
+    global pending_encode
+    if pending_encode is not None:
+        root.after_cancel(pending_encode)
+        pending_encode = None
+    if document['dirty']:
+        json_data = json_text.get('1.0', tk.END).strip()
+        key = hashlib.sha256(json_data.encode('utf-8')).hexdigest()
+        payload = ('text', json_data, key)
+    else:
+        # Encode the parsed document directly, the text pane is not read back
+        key = ('document', document['version'])
+        payload = ('data', document['data'], key)
+    if key in encode_cache:
+        # Same document as before: switching encodings is instant
+        latest_generation['encode'] += 1
+        encode_cache.move_to_end(key)
+        show_encoded(key, encode_cache[key], None)
+        return
+    encoding_status.set("Encoding...")
+    submit('encode', payload)
+
+def schedule_encode(*args):
+    # Re-encode once typing has paused
+    global pending_encode
+    if pending_encode is not None:
+        root.after_cancel(pending_encode)
+    pending_encode = root.after(DEBOUNCE_MS, encode_and_update)
+
+def show_encoded(key, encodings, error):
     encoding_type = encoding_var.get()
-    try:
-        data = json.loads(json_data)
-        if encoding_type == "Glamourer":
-            encoded_data = glamourer_encode(data)
-        elif encoding_type == "Base64 (Compressed)":
-            encoded_data = standard_encode(data, compress=True)
-        else:  # "Base64 (Uncompressed)"
-            encoded_data = standard_encode(data, compress=False)
-        
-        base64_text.delete('1.0', tk.END)
-        base64_text.insert(tk.END, encoded_data)
+    base64_text.delete('1.0', tk.END)
+    if error is None:
+        encode_cache[key] = encodings
+        while len(encode_cache) > CACHE_SIZE:
+            encode_cache.popitem(last=False)
+        # Anything typed into the combobox falls back to uncompressed, as encode() does
+        base64_text.insert(tk.END, encodings.get(encoding_type, encodings[FORMAT_UNCOMPRESSED]))
         encoding_status.set(f"Encoded: {encoding_type}")
-    except json.JSONDecodeError:
-        base64_text.delete('1.0', tk.END)
+    elif isinstance(error, json.JSONDecodeError):
         base64_text.insert(tk.END, "Invalid JSON")
         encoding_status.set("Error: Invalid JSON")
-    except Exception as e:
-        base64_text.delete('1.0', tk.END)
-        base64_text.insert(tk.END, f"Error: {str(e)}")
+    else:
+        base64_text.insert(tk.END, f"Error: {str(error)}")
         encoding_status.set("Error: Encoding failed")
 
 def decode_and_update(*args):
     base64_data = base64_text.get('1.0', tk.END).strip()
-    try:
-        decoded_data = decode_and_decompress(base64_data)
-        json_text.delete('1.0', tk.END)
-        json_text.insert(tk.END, json.dumps(decoded_data, indent=4))
-        if is_glamourer_encoded(base64_data):
-            encoding_status.set("Decoded: Glamourer")
-        elif is_compressed(base64_data):
-            encoding_status.set("Decoded: Base64 (Compressed)")
-        else:
-            encoding_status.set("Decoded: Base64 (Uncompressed)")
-    except Exception as e:
-        json_text.delete('1.0', tk.END)
-        json_text.insert(tk.END, f"Error: {str(e)}")
+    encoding_status.set("Decoding...")
+    submit('decode', base64_data)
+
+def show_decoded(result, error):
+    if error is None:
+        decoded_data, encoding_type, size, text = result
+        set_document(decoded_data, size, text)
+        encoding_status.set(f"Decoded: {encoding_type}")
+    else:
+        set_json_text(f"Error: {str(error)}")
         encoding_status.set("Error: Decoding failed")
 
-# GUI setup
-root = tk.Tk()
-root.title("JSON Base64 Encoder/Decoder with Glamourer Support")
+if __name__ == "__main__":
+    # GUI setup
+    root = tk.Tk()
+    root.title("JSON Base64 Encoder/Decoder with Glamourer Support")
+
+    notebook = ttk.Notebook(root)
+    notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    # JSON tab
+    json_frame = ttk.Frame(notebook)
+    notebook.add(json_frame, text="JSON")
 
-notebook = ttk.Notebook(root)
-notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+    json_text = tk.Text(json_frame, wrap='word', height=10, width=60, yscrollcommand=on_json_scroll)
+    json_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    json_text.bind('<KeyRelease>', on_json_edit)
+    json_text.bind('<ButtonRelease>', on_json_edit)  # middle-click paste, drag and drop
 
-# JSON tab
-json_frame = ttk.Frame(notebook)
-notebook.add(json_frame, text="JSON")
+    # Encoding options
+    encoding_frame = ttk.Frame(json_frame)
+    encoding_frame.pack(fill=tk.X, padx=5, pady=5)
 
-json_text = tk.Text(json_frame, wrap='word', height=10, width=60)
-json_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    encoding_var = tk.StringVar(value=FORMAT_GLAMOURER)
+    encoding_label = ttk.Label(encoding_frame, text="Encoding:")
+    encoding_label.pack(side=tk.LEFT)
+    encoding_menu = ttk.Combobox(encoding_frame, textvariable=encoding_var, 
+                                 values=[FORMAT_GLAMOURER, FORMAT_COMPRESSED, FORMAT_UNCOMPRESSED])
+    encoding_menu.pack(side=tk.LEFT, padx=5)
+    encoding_menu.bind('<<ComboboxSelected>>', encode_and_update)
 
-# Encoding options
-encoding_frame = ttk.Frame(json_frame)
-encoding_frame.pack(fill=tk.X, padx=5, pady=5)
+    encode_button = ttk.Button(encoding_frame, text="Encode", command=encode_and_update)
+    encode_button.pack(side=tk.LEFT, padx=5)
 
-encoding_var = tk.StringVar(value="Glamourer")
-encoding_label = ttk.Label(encoding_frame, text="Encoding:")
-encoding_label.pack(side=tk.LEFT)
-encoding_menu = ttk.Combobox(encoding_frame, textvariable=encoding_var, 
-                             values=["Glamourer", "Base64 (Compressed)", "Base64 (Uncompressed)"])
-encoding_menu.pack(side=tk.LEFT, padx=5)
-encoding_menu.bind('<<ComboboxSelected>>', encode_and_update)
+    # Tree tab: the parsed document, children inserted when a node is opened
+    tree_frame = ttk.Frame(notebook)
+    notebook.add(tree_frame, text="Tree")
 
-encode_button = ttk.Button(encoding_frame, text="Encode", command=encode_and_update)
-encode_button.pack(side=tk.LEFT, padx=5)
+    json_tree = ttk.Treeview(tree_frame, show='tree')
+    tree_scroll = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=json_tree.yview)
+    json_tree.configure(yscrollcommand=tree_scroll.set)
+    tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+    json_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    json_tree.bind('<<TreeviewOpen>>', expand_tree_node)
 
-# Base64 tab
-base64_frame = ttk.Frame(notebook)
-notebook.add(base64_frame, text="Base64")
+    # Base64 tab
+    base64_frame = ttk.Frame(notebook)
+    notebook.add(base64_frame, text="Base64")
 
-base64_text = tk.Text(base64_frame, wrap='word', height=10, width=60)
-base64_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    base64_text = tk.Text(base64_frame, wrap='word', height=10, width=60)
+    base64_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-decode_button = ttk.Button(base64_frame, text="Decode", command=decode_and_update)
-decode_button.pack(pady=5)
+    decode_button = ttk.Button(base64_frame, text="Decode", command=decode_and_update)
+    decode_button.pack(pady=5)
 
-# Status bar
-status_frame = ttk.Frame(root)
-status_frame.pack(fill=tk.X, padx=10, pady=5)
+    # Status bar
+    status_frame = ttk.Frame(root)
+    status_frame.pack(fill=tk.X, padx=10, pady=5)
 
-encoding_status = tk.StringVar(value="Ready")
-status_label = ttk.Label(status_frame, text="Status:")
-status_label.pack(side=tk.LEFT)
-status_value = ttk.Label(status_frame, textvariable=encoding_status)
-status_value.pack(side=tk.LEFT)
+    encoding_status = tk.StringVar(value="Ready")
+    status_label = ttk.Label(status_frame, text="Status:")
+    status_label.pack(side=tk.LEFT)
+    status_value = ttk.Label(status_frame, textvariable=encoding_status)
+    status_value.pack(side=tk.LEFT)
 
-# Buttons
-button_frame = tk.Frame(root)
-button_frame.pack(pady=10)
+    # Buttons
+    button_frame = tk.Frame(root)
+    button_frame.pack(pady=10)
 
-load_button = tk.Button(button_frame, text="Load JSON File", command=load_json_file)
-load_button.pack(side=tk.LEFT, padx=5)
+    load_button = tk.Button(button_frame, text="Load JSON File", command=load_json_file)
+    load_button.pack(side=tk.LEFT, padx=5)
 
-save_button = tk.Button(button_frame, text="Save JSON File", command=save_json_file)
-save_button.pack(side=tk.LEFT, padx=5)
+    save_button = tk.Button(button_frame, text="Save JSON File", command=save_json_file)
+    save_button.pack(side=tk.LEFT, padx=5)
 
-root.mainloop()
+    threading.Thread(target=codec_worker, daemon=True).start()
+    root.after(POLL_MS, poll_results)
+    root.mainloop()
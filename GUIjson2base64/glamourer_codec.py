@@ -0,0 +1,209 @@
+"""Glamourer / Base64 JSON codec, usable without the GUI.
+
+As a script it converts newline-delimited input, one document per line:
+
+    python glamourer_codec.py encode designs.ndjson > designs.b64
+    python glamourer_codec.py decode --jobs 8 < designs.b64 > designs.ndjson
+
+Every output line matches the input line at the same position. A line that
+fails to convert leaves an empty line and an error on stderr.
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+GLAMOURER_VERSION_BYTE = b'\x06'
+GZIP_MAGIC = b'\x1f\x8b'
+DEFAULT_LEVEL = 9  # gzip's own default
+
+# Format names, as shown in the GUI's encoding combobox
+FORMAT_GLAMOURER = "Glamourer"
+FORMAT_COMPRESSED = "Base64 (Compressed)"
+FORMAT_UNCOMPRESSED = "Base64 (Uncompressed)"
+FORMATS = {'glamourer': FORMAT_GLAMOURER, 'compressed': FORMAT_COMPRESSED, 'uncompressed': FORMAT_UNCOMPRESSED}
+
+def remove_bom(file_content):
+    return file_content.lstrip('\ufeff')
+
+def glamourer_encode(data, level=DEFAULT_LEVEL):
+    json_string = json.dumps(data)
+    compressed_data = gzip.compress(json_string.encode('utf-8'), compresslevel=level)
+    return base64.b64encode(GLAMOURER_VERSION_BYTE + compressed_data).decode('utf-8')
+
+def standard_encode(data, compress=False, level=DEFAULT_LEVEL):
+    json_string = json.dumps(data)
+    if compress:
+        compressed_data = gzip.compress(json_string.encode('utf-8'), compresslevel=level)
+        return base64.b64encode(compressed_data).decode('utf-8')
+    else:
+        return base64.b64encode(json_string.encode('utf-8')).decode('utf-8')
+
+def encode(data, encoding_type=FORMAT_GLAMOURER, level=DEFAULT_LEVEL):
+    if encoding_type == FORMAT_GLAMOURER:
+        return glamourer_encode(data, level)
+    elif encoding_type == FORMAT_COMPRESSED:
+        return standard_encode(data, compress=True, level=level)
+    else:  # FORMAT_UNCOMPRESSED
+        return standard_encode(data, compress=False)
+
+def encode_all(data, level=DEFAULT_LEVEL):
+    # Every format at once: one json.dumps and one gzip pass, Glamourer is
+    # just the compressed stream behind the version byte
+    json_bytes = json.dumps(data).encode('utf-8')
+    compressed_data = gzip.compress(json_bytes, compresslevel=level)
+    return {
+        FORMAT_GLAMOURER: base64.b64encode(GLAMOURER_VERSION_BYTE + compressed_data).decode('utf-8'),
+        FORMAT_COMPRESSED: base64.b64encode(compressed_data).decode('utf-8'),
+        FORMAT_UNCOMPRESSED: base64.b64encode(json_bytes).decode('utf-8'),
+    }
+
+def glamourer_decode(base64_data):
+    decoded_data = base64.b64decode(base64_data)
+    if decoded_data[0:1] != GLAMOURER_VERSION_BYTE:
+        raise ValueError("Invalid Glamourer version byte")
+    decompressed_data = gzip.decompress(decoded_data[1:]).decode('utf-8')
+    return json.loads(decompressed_data)
+
+def standard_decode(base64_data, compressed=False):
+    decoded_data = base64.b64decode(base64_data)
+    if compressed:
+        decompressed_data = gzip.decompress(decoded_data).decode('utf-8')
+    else:
+        decompressed_data = decoded_data.decode('utf-8')
+    return json.loads(decompressed_data)
+
+def is_glamourer_encoded(base64_data):
+    try:
+        decoded_data = base64.b64decode(base64_data)
+        return decoded_data[0:1] == GLAMOURER_VERSION_BYTE
+    except:
+        return False
+
+def is_compressed(base64_data):
+    try:
+        decoded_data = base64.b64decode(base64_data)
+        return decoded_data[0:2] == GZIP_MAGIC
+    except:
+        return False
+
+def detect_and_decode(base64_data):
+    # Decode once, tell the format from the first bytes, decompress at most once
+    decoded_data = base64.b64decode(base64_data)
+    if decoded_data[0:1] == GLAMOURER_VERSION_BYTE:
+        return json.loads(gzip.decompress(decoded_data[1:]).decode('utf-8')), FORMAT_GLAMOURER
+    if decoded_data[0:2] == GZIP_MAGIC:
+        return json.loads(gzip.decompress(decoded_data).decode('utf-8')), FORMAT_COMPRESSED
+    return json.loads(decoded_data.decode('utf-8')), FORMAT_UNCOMPRESSED
+
+def decode_and_decompress(base64_data):
+    return detect_and_decode(base64_data)[0]
+
+# --- batch conversion ---------------------------------------------------------
+
+def convert_line(line, command, encoding_type=FORMAT_GLAMOURER, level=DEFAULT_LEVEL, show_format=False):
+    """Convert one input line, return (output line, error message or None)."""
+    line = remove_bom(line).strip()
+    if not line:
+        return '', None
+    try:
+        if command == 'encode':
+            return encode(json.loads(line), encoding_type, level), None
+        data, detected = detect_and_decode(line)
+        output = json.dumps(data, ensure_ascii=False)
+        return (f"{detected}\t{output}" if show_format else output), None
+    except Exception as e:
+        return '', f"{type(e).__name__}: {e}"
+
+def convert_batch(lines, command, encoding_type=FORMAT_GLAMOURER, level=DEFAULT_LEVEL, show_format=False):
+    return [convert_line(line, command, encoding_type, level, show_format) for line in lines]
+
+def iter_lines(paths):
+    # (source, line number, text) for every line of the files, or of stdin
+    if not paths:
+        for number, line in enumerate(sys.stdin, 1):
+            yield '<stdin>', number, line
+        return
+    for path in paths:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for number, line in enumerate(f, 1):
+                yield path, number, line
+
+def iter_batches(items, batch_size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def convert_stream(paths, command, encoding_type=FORMAT_GLAMOURER, level=DEFAULT_LEVEL, show_format=False,
+                   jobs=1, batch_size=256, output=None):
+    """Convert every line of paths (stdin if empty) to output, return the number of failed lines.
+
+    With jobs > 1 batches of lines go to a process pool; at most 2*jobs
+    batches are in flight and results are written in input order.
+    """
+    output = output or sys.stdout
+    failures = 0
+
+    def write(batch, results):
+        nonlocal failures
+        for (source, number, _), (converted, error) in zip(batch, results):
+            if error:
+                failures += 1
+                print(f"{source}:{number}: {error}", file=sys.stderr)
+            output.write(converted + '\n')
+
+    batches = iter_batches(iter_lines(paths), batch_size)
+    if jobs <= 1:
+        for batch in batches:
+            write(batch, convert_batch([line for _, _, line in batch], command, encoding_type, level, show_format))
+        return failures
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for batch in batches:
+            job = pool.submit(convert_batch, [line for _, _, line in batch], command, encoding_type, level,
+                              show_format)
+            pending.append((batch, job))
+            while len(pending) > jobs * 2:
+                batch, job = pending.popleft()
+                write(batch, job.result())
+        while pending:
+            batch, job = pending.popleft()
+            write(batch, job.result())
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode/decode newline-delimited Glamourer and Base64 JSON")
+    parser.add_argument("command", choices=('encode', 'decode'))
+    parser.add_argument("files", nargs='*', help="input files (default: stdin)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default='glamourer', help="output format for encode")
+    parser.add_argument("-l", "--level", type=int, default=DEFAULT_LEVEL, choices=range(0, 10), metavar="0-9",
+                        help="gzip compression level for encode: lower is faster, 9 is smallest (default)")
+    parser.add_argument("--show-format", action="store_true",
+                        help="decode: prefix each line with the detected format and a tab")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes (0 = one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=256, help="lines sent to a worker at a time")
+    if len(sys.argv) == 1:
+        # parse_intermixed_args would also report the optional files as missing
+        parser.print_help()
+        return 2
+    # Options may come before or after the files
+    args = parser.parse_intermixed_args()
+
+    jobs = args.jobs or os.cpu_count() or 1
+    failures = convert_stream(args.files, args.command, FORMATS[args.format], args.level, args.show_format,
+                              jobs, args.batch_size)
+    if failures:
+        print(f"{failures} line(s) failed", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""Benchmarks for the scripts in this repo.
+
+Generates synthetic inputs in a scratch directory, runs every case in a
+fresh child process and records the best wall time of a few runs, the peak
+of traced Python allocations and the child's peak RSS. Results are written
+as JSON together with the git commit, so two runs can be compared:
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json
+
+Suites whose dependencies (Pillow, NumPy) are missing are reported as
+skipped instead of failing.
+"""
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from queue import Empty
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+POLL_SECONDS = 1  # how often measure() checks that a case's child is still alive
+
+# name -> (suite, required modules, factory); the factory gets the input
+# directory and returns the function to time
+CASES = {}
+
+def case(name, suite, requires=()):
+    def register(factory):
+        CASES[name] = (suite, requires, factory)
+        return factory
+    return register
+
+def load_script(relative_path, module_name):
+    """Import a script by path, for file names that are not valid module names."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def missing_modules(requires):
+    return [name for name in requires if importlib.util.find_spec(name) is None]
+
+def quiet(func, *args, **kwargs):
+    # The scripts print progress for every file, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+# --- synthetic inputs -------------------------------------------------------
+
+def make_inputs(input_dir, quick=False):
+    scale = 4 if quick else 1
+    os.makedirs(os.path.join(input_dir, 'out'), exist_ok=True)
+    random.seed(0)
+    if not missing_modules(['PIL']):
+        make_images(input_dir, scale)
+    make_exports(input_dir, scale)
+    make_glamourer(input_dir, scale)
+    make_webp_headers(input_dir, scale)
+
+def make_images(input_dir, scale):
+    from PIL import Image, ImageDraw
+
+    # Large still image: flat background, a few shapes with soft edges
+    size = 2048 // scale
+    still = Image.new('RGB', (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(still)
+    for _ in range(40):
+        x, y = random.randrange(size), random.randrange(size)
+        radius = random.randrange(size // 40, size // 8)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                     fill=tuple(random.randrange(256) for _ in range(3)))
+    still.save(os.path.join(input_dir, 'still.png'))
+
+    # Animated GIF: a ball moving over a flat background
+    width, height, count = 480 // scale, 270 // scale, 48 // scale
+    frames = []
+    for index in range(count):
+        frame = Image.new('RGB', (width, height), (0, 255, 0))
+        draw = ImageDraw.Draw(frame)
+        x = width * index // count
+        draw.ellipse((x, height // 3, x + height // 3, 2 * height // 3), fill=(200, 40, 40))
+        draw.rectangle((width // 2, 10, width // 2 + 30, 40), fill=(40, 40, 200))
+        frames.append(frame)
+    frames[0].save(os.path.join(input_dir, 'anim.gif'), save_all=True, append_images=frames[1:],
+                   duration=60, loop=0)
+
+def make_exports(input_dir, scale):
+    # AI Studio export: chat turns with a repeated and a unique inline image each
+    shared = base64.b64encode(os.urandom(256 * 1024)).decode('ascii')
+    chunks = []
+    for index in range(16 // scale):
+        chunks.append({'role': 'user', 'text': 'turn %d ' % index * 50})
+        chunks.append({'role': 'model', 'parts': [
+            {'inlineData': {'mimeType': 'image/png', 'data': shared}},
+            {'inline_data': {'mimeType': 'image/jpeg',
+                             'data': base64.b64encode(os.urandom(2 * 1024 * 1024 // scale)).decode('ascii')}},
+        ]})
+    with open(os.path.join(input_dir, 'export.json'), 'w', encoding='utf-8') as f:
+        json.dump({'runSettings': {'model': 'synthetic'}, 'chunkedPrompt': {'chunks': chunks}}, f, indent=2)
+
+def make_glamourer(input_dir, scale):
+    # Glamourer-like design document, a few MB of nested JSON
+    design = {'FileVersion': 1, 'Equipment': {}, 'Customize': {}, 'Materials': {}}
+    for index in range(20000 // scale):
+        design['Materials'][f'Slot{index}'] = {
+            'Value': {'DiffuseR': random.random(), 'DiffuseG': random.random(), 'DiffuseB': random.random()},
+            'Enabled': index % 3 == 0,
+            'Gloss': random.randrange(1000),
+        }
+    with open(os.path.join(input_dir, 'design.json'), 'w', encoding='utf-8') as f:
+        json.dump(design, f)
+
+def make_webp_headers(input_dir, scale):
+    # Telegram sticker folder: static WebP, animated WebP and WebM headers
+    folder = os.path.join(input_dir, 'stickers')
+    os.makedirs(folder, exist_ok=True)
+    webm = b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x84webm' + b'\x00' * 64 + b'\x86\x85V_VP9'
+    headers = [b'RIFF\x00\x00\x00\x00WEBPVP8 ', b'RIFF\x00\x00\x00\x00WEBPVP8X\x0a\x00\x00\x00\x02', webm]
+    for index in range(600 // scale):
+        with open(os.path.join(folder, f'{index}.webp'), 'wb') as f:
+            f.write(headers[index % 3] + os.urandom(4096))
+
+# --- cases ------------------------------------------------------------------
+
+def background_remover():
+    return load_script(os.path.join('transparentgif', 'background_remover.py'), 'background_remover')
+
+for strategy in ('exact', 'border', 'histogram'):
+    @case(f'background_remover.get_background_color[{strategy}]', 'background_remover', ['PIL'])
+    def _(input_dir, strategy=strategy):
+        from PIL import Image
+        module = background_remover()
+        image = Image.open(os.path.join(input_dir, 'still.png')).convert('RGBA')
+        return lambda: module.get_background_color(image, 10, strategy)
+
+@case('background_remover.remove_background', 'background_remover', ['PIL'])
+def _(input_dir):
+    from PIL import Image
+    module = background_remover()
+    image = Image.open(os.path.join(input_dir, 'still.png')).convert('RGBA')
+    return lambda: module.remove_background(image, (255, 255, 255, 255), 10)
+
+@case('background_remover.remove_background[python]', 'background_remover', ['PIL'])
+def _(input_dir):
+    from PIL import Image
+    module = background_remover()
+    module.np = None  # force the pure Python loop
+    image = Image.open(os.path.join(input_dir, 'still.png')).convert('RGBA')
+    image = image.resize((image.width // 4, image.height // 4))
+    return lambda: module.remove_background(image, (255, 255, 255, 255), 10)
+
+for kernel in ('smooth', 'gaussian:2'):
+    @case(f'background_remover.post_process[{kernel}]', 'background_remover', ['PIL'])
+    def _(input_dir, kernel=kernel):
+        from PIL import Image
+        module = background_remover()
+        image = Image.open(os.path.join(input_dir, 'still.png')).convert('RGBA')
+        image = module.remove_background(image, (255, 255, 255, 255), 10)
+        return lambda: module.post_process(image.copy(), kernel=kernel)
+
+@case('background_remover.gif_union_bbox', 'background_remover', ['PIL'])
+def _(input_dir):
+    from PIL import Image
+    module = background_remover()
+    image = Image.open(os.path.join(input_dir, 'anim.gif'))
+    return lambda: module.gif_union_bbox(image, (255, 255, 255, 255), 10)
+
+@case('background_remover.process_image[png]', 'background_remover', ['PIL'])
+def _(input_dir):
+    module = background_remover()
+    output = os.path.join(input_dir, 'out', 'still.png')
+    return lambda: quiet(module.process_image, os.path.join(input_dir, 'still.png'), output)
+
+for name, options in (('gif', {}), ('gif,fast_gif', {'fast_gif': True}), ('gif,frame_workers=4', {'frame_workers': 4})):
+    @case(f'background_remover.process_image[{name}]', 'background_remover', ['PIL'])
+    def _(input_dir, options=options):
+        module = background_remover()
+        output = os.path.join(input_dir, 'out', 'anim.gif')
+        return lambda: quiet(module.process_image, os.path.join(input_dir, 'anim.gif'), output, **options)
+
+for name, options, requires in (
+        ('blend', {}, ['PIL']),
+        ('blend,fast_gif', {'fast_gif': True}, ['PIL']),
+        ('motion', {'mode': 'motion'}, ['PIL', 'numpy']),
+        ('motion,workers=4', {'mode': 'motion', 'workers': 4}, ['PIL', 'numpy'])):
+    @case(f'gifframeinsert.insert_frames[{name}]', 'gifframeinsert', requires)
+    def _(input_dir, options=options):
+        sys.path.insert(0, ROOT)
+        import gifframeinsert
+        output = os.path.join(input_dir, 'out', 'inserted.gif')
+        return lambda: gifframeinsert.insert_frames(os.path.join(input_dir, 'anim.gif'), output, 3, **options)
+
+for name, options in (('memory', {}), ('stream', {'stream': True}), ('memory,write_threads=4', {'write_threads': 4})):
+    @case(f'parse_aistudio.parse_ai_studio_json[{name}]', 'parse_aistudio')
+    def _(input_dir, options=options):
+        sys.path.insert(0, ROOT)
+        import parse_aistudio
+        output = os.path.join(input_dir, 'out', 'images')
+        os.makedirs(output, exist_ok=True)
+        return lambda: quiet(parse_aistudio.parse_ai_studio_json, os.path.join(input_dir, 'export.json'),
+                             output, **options)
+
+@case('parse_aistudio.parse_ai_studio_json[dedupe]', 'parse_aistudio')
+def _(input_dir):
+    sys.path.insert(0, ROOT)
+    import parse_aistudio
+
+    def run():
+        # Fresh store every run, so this measures a first run with duplicates
+        output = os.path.join(input_dir, 'out', 'dedupe')
+        shutil.rmtree(output, ignore_errors=True)
+        os.makedirs(output)
+        quiet(parse_aistudio.parse_ai_studio_json, os.path.join(input_dir, 'export.json'), output,
+              store=parse_aistudio.ImageStore(output))
+    return run
+
+def glamourer_codec():
+    sys.path.insert(0, os.path.join(ROOT, 'GUIjson2base64'))
+    import glamourer_codec
+    return glamourer_codec
+
+def load_design(input_dir):
+    with open(os.path.join(input_dir, 'design.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+@case('glamourer.glamourer_encode', 'glamourer')
+def _(input_dir):
+    module = glamourer_codec()
+    design = load_design(input_dir)
+    return lambda: module.glamourer_encode(design)
+
+@case('glamourer.standard_encode[compressed]', 'glamourer')
+def _(input_dir):
+    module = glamourer_codec()
+    design = load_design(input_dir)
+    return lambda: module.standard_encode(design, compress=True)
+
+for name, encode in (('glamourer', lambda module, design: module.glamourer_encode(design)),
+                     ('compressed', lambda module, design: module.standard_encode(design, compress=True)),
+                     ('uncompressed', lambda module, design: module.standard_encode(design))):
+    @case(f'glamourer.decode_and_decompress[{name}]', 'glamourer')
+    def _(input_dir, encode=encode):
+        module = glamourer_codec()
+        encoded = encode(module, load_design(input_dir))
+        return lambda: module.decode_and_decompress(encoded)
+
+for name, options in (('level=9', {}), ('level=1', {'level': 1}), ('level=9,jobs=4', {'jobs': 4})):
+    @case(f'glamourer.convert_stream[encode,{name}]', 'glamourer')
+    def _(input_dir, options=options):
+        module = glamourer_codec()
+        with open(os.path.join(input_dir, 'design.json'), encoding='utf-8') as f:
+            design = json.load(f)
+        # Many small designs, one per line, like a batch job would see
+        path = os.path.join(input_dir, 'designs.ndjson')
+        materials = list(design['Materials'].items())
+        with open(path, 'w', encoding='utf-8') as f:
+            for start in range(0, len(materials), 50):
+                f.write(json.dumps({'FileVersion': 1, 'Materials': dict(materials[start:start + 50])}) + '\n')
+        return lambda: module.convert_stream([path], 'encode', output=io.StringIO(), **options)
+
+@case('tg_webp.sniff_codec', 'tg_webp')
+def _(input_dir):
+    module = load_script('ffmpeg TG webp convert.py', 'tg_webp_convert')
+    folder = os.path.join(input_dir, 'stickers')
+    paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+    return lambda: [module.sniff_codec(path) for path in paths]
+
+# --- running ----------------------------------------------------------------
+
+def run_case(name, input_dir, repeat, queue):
+    """Child process entry point: time one case and send back its numbers."""
+    suite, requires, factory = CASES[name]
+    try:
+        func = factory(input_dir)
+        func()  # warm up: imports, caches, pools
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+        # tracemalloc slows everything down, so the traced run is not timed
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result = {'seconds': min(runs), 'runs': runs, 'peak_traced_mb': peak / 1024 / 1024}
+        if resource:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes on Linux, bytes on macOS
+            result['max_rss_mb'] = max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+    except Exception as e:
+        result = {'error': f"{type(e).__name__}: {e}"}
+    queue.put(result)
+
+def measure(name, input_dir, repeat):
+    suite, requires, factory = CASES[name]
+    missing = missing_modules(requires)
+    if missing:
+        return {'skipped': 'missing ' + ', '.join(missing)}
+    # spawn, not fork: every case starts from a clean interpreter and its
+    # peak RSS is not inherited from the parent
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(name, input_dir, repeat, queue))
+    process.start()
+    try:
+        while True:
+            try:
+                return queue.get(timeout=POLL_SECONDS)
+            except Empty:
+                pass
+            if not process.is_alive():
+                # Killed or crashed before reporting; the result may still be in flight
+                try:
+                    return queue.get(timeout=POLL_SECONDS)
+                except Empty:
+                    return {'error': f'exit code {process.exitcode}'}
+    finally:
+        process.join()
+
+def git_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def compare(results, baseline, threshold):
+    """Print the change against a previous results file, return the regressed cases."""
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'unknown commit'}:")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name, {})
+        if 'seconds' not in result or 'seconds' not in before:
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  <-- slower'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = '  faster'
+        print(f"  {name:60} {before['seconds']:8.3f}s -> {result['seconds']:8.3f}s  x{ratio:5.2f}{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scripts in this repo")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression (default 0.1)")
+    parser.add_argument("-k", "--filter", default='', help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the best one counts")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, for a fast smoke run")
+    parser.add_argument("--inputs", help="directory for the generated inputs (default: a temp dir)")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    input_dir = args.inputs or tempfile.mkdtemp(prefix='mypythonscript-bench-')
+    print(f"Generating inputs in {input_dir}")
+    make_inputs(input_dir, args.quick)
+
+    commit, dirty = git_info()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'quick': args.quick,
+        'repeat': args.repeat,
+        'results': {},
+    }
+    try:
+        for name in names:
+            result = measure(name, input_dir, args.repeat)
+            report['results'][name] = result
+            if 'seconds' in result:
+                rss = f", rss {result['max_rss_mb']:.0f} MB" if 'max_rss_mb' in result else ''
+                print(f"  {name:60} {result['seconds']:8.3f}s  peak {result['peak_traced_mb']:7.1f} MB{rss}")
+            else:
+                print(f"  {name:60} {result.get('skipped') or result.get('error')}")
+    finally:
+        if not args.inputs:
+            shutil.rmtree(input_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report['results'], baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,179 @@
+import argparse
+import mmap
 import os
+import re
 import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-def convert_webp_to_correct_format():
-    input_folder = os.getcwd()  # 获取当前工作目录
+from metrics import Record, configure_metrics
+
+SNIFF_BYTES = 64 * 1024  # 只读取文件开头这么多字节来判断格式
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+# Matroska CodecID 元素 (0x86)，长度 5 (0x85)，内容 V_VP8 / V_VP9
+WEBM_CODEC_ID = re.compile(rb'\x86\x85V_(VP8|VP9)')
+
+def run_tool(args):
+    # 运行 ffprobe/ffmpeg，失败时抛出异常并附带 stderr 的最后一行
+    result = subprocess.run(args, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"{args[0]} 退出码 {result.returncode}")
+    return result.stdout
+
+def sniff_codec(input_path):
+    # 直接解析文件头判断格式，返回 (codec_name, 是否动态)，无法确定时返回 None
+    # codec_name 与 ffprobe 的输出一致：'webp'、'vp8' 或 'vp9'
+    try:
+        with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header = data[:SNIFF_BYTES]
+    except (OSError, ValueError):  # 空文件无法 mmap
+        return None
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        chunk = header[12:16]
+        if chunk in (b'VP8 ', b'VP8L'):
+            return 'webp', False
+        if chunk == b'VP8X' and len(header) > 20:
+            # VP8X 标志位中的 0x02 表示含有 ANIM/ANMF 动画块
+            return 'webp', bool(header[20] & 0x02)
+        return None
+
+    if header[:4] == EBML_MAGIC:
+        match = WEBM_CODEC_ID.search(header)
+        if match:
+            return match.group(1).decode('ascii').lower(), True
+    return None
+
+def probe_codec(input_path):
+    # 识别文件类型
+    return run_tool(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_name', '-of', 'default=noprint_wrappers=1:nokey=1', input_path]
+    ).strip()
+
+def convert_file(input_path, output_folder, file_type):
+    filename = os.path.basename(input_path)
+    if file_type == 'vp8' or file_type == 'vp9':
+        # 是WebM视频文件，转换为GIF
+        output_path = os.path.join(output_folder, filename.replace(".webp", ".gif"))
+        run_tool(['ffmpeg', '-i', input_path, output_path])
+        return "转换完成", output_path
+    else:
+        # 只是WebP图片文件，直接复制到输出文件夹
+        output_path = os.path.join(output_folder, filename)
+        os.rename(input_path, output_path)
+        return "复制完成", output_path
+
+def timed(func, *args):
+    start = time.perf_counter()
+    return func(*args), time.perf_counter() - start
+
+def convert_webp_to_correct_format(input_folder=None, jobs=None):
+    input_folder = input_folder or os.getcwd()  # 默认使用当前工作目录
     output_folder = os.path.join(input_folder, 'output')  # 创建输出文件夹路径
+    jobs = jobs or os.cpu_count() or 1
 
     # 确保输出文件夹存在
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
-    # 遍历输入文件夹中的所有文件
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".webp"):
+
+    filenames = [filename for filename in os.listdir(input_folder) if filename.endswith(".webp")]
+    stage_times = {'sniff': [0.0, 0], 'probe': [0.0, 0], 'convert': [0.0, 0]}  # 阶段 -> [累计秒数, 文件数]
+    animated_count = 0
+    failures = []
+    records = {}  # 文件名 -> Record，文件转换完成或失败时写出
+    summary = Record('tg_webp.convert_webp_to_correct_format', folder=input_folder, jobs=jobs)
+    start = time.perf_counter()
+
+    # 探测和转换各用一个线程池：探测完成的文件立即进入转换阶段，两个阶段流水线并行
+    with ThreadPoolExecutor(max_workers=jobs) as probe_pool, ThreadPoolExecutor(max_workers=jobs) as convert_pool:
+        tasks = {}
+        pending = set()
+
+        def submit(pool, filename, stage, *args):
+            future = pool.submit(timed, *args)
+            tasks[future] = (filename, stage)
+            pending.add(future)
+
+        for filename in filenames:
             input_path = os.path.join(input_folder, filename)
-            
-            # 识别文件类型
-            file_type = subprocess.run(
-                ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_name', '-of', 'default=noprint_wrappers=1:nokey=1', input_path],
-                capture_output=True, text=True
-            ).stdout.strip()
-            
-            if file_type == 'vp8' or file_type == 'vp9':
-                # 是WebM视频文件，转换为GIF
-                output_path = os.path.join(output_folder, filename.replace(".webp", ".gif"))
-                subprocess.run(['ffmpeg', '-i', input_path, output_path])
-                print(f"转换完成: {filename} -> {output_path}")
+            record = records[filename] = Record('tg_webp.convert_file', input=input_path)
+            record.count('bytes_in', os.path.getsize(input_path))
+            # 先在进程内读文件头，只有判断不了的文件才启动 ffprobe
+            sniffed, elapsed = timed(sniff_codec, input_path)
+            record.add_time('sniff', elapsed)
+            summary.add_time('sniff', elapsed)
+            if sniffed is None:
+                submit(probe_pool, filename, 'probe', probe_codec, input_path)
             else:
-                # 只是WebP图片文件，直接复制到输出文件夹
-                output_path = os.path.join(output_folder, filename)
-                os.rename(input_path, output_path)
-                print(f"复制完成: {filename} -> {output_path}")
+                file_type, animated = sniffed
+                stage_times['sniff'][0] += elapsed
+                stage_times['sniff'][1] += 1
+                animated_count += animated
+                submit(convert_pool, filename, 'convert', convert_file, input_path, output_folder, file_type)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                filename, stage = tasks.pop(future)
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    failures.append((filename, stage, str(e)))
+                    print(f"失败: {filename} ({e})")
+                    records.pop(filename).close(failed_stage=stage, error=str(e))
+                    continue
+                stage_times[stage][0] += elapsed
+                stage_times[stage][1] += 1
+                records[filename].add_time(stage, elapsed)
+                summary.add_time(stage, elapsed)
+                if stage == 'probe':
+                    input_path = os.path.join(input_folder, filename)
+                    submit(convert_pool, filename, 'convert', convert_file, input_path, output_folder, result)
+                else:
+                    action, output_path = result
+                    print(f"{action}: {filename} -> {output_path} ({elapsed:.2f}s)")
+                    record = records.pop(filename)
+                    record.count('bytes_out', os.path.getsize(output_path))
+                    record.close(output=output_path)
+
+    elapsed = time.perf_counter() - start
+    count = len(filenames)
+    summary.count('files', count)
+    summary.count('animated', animated_count)
+    summary.count('failures', len(failures))
+    summary.close()
+    print()
+    for stage, label in (('sniff', "文件头识别"), ('probe', "ffprobe 探测"), ('convert', "转换阶段")):
+        total, done_count = stage_times[stage]
+        print(f"{label}: {done_count} 个文件，累计 {total:.2f}s，平均 {total / max(done_count, 1) * 1000:.0f} ms/文件")
+    print(f"文件头识别出 {animated_count} 个动态文件，{stage_times['sniff'][1] - animated_count} 个静态文件")
+    print(f"共 {count} 个文件，用时 {elapsed:.2f}s（{count / elapsed if elapsed else 0:.1f} 文件/秒，并发 {jobs}）")
+    if failures:
+        print(f"\n失败 {len(failures)} 个:")
+        for filename, stage, message in failures:
+            print(f"  {filename} [{stage}]: {message}")
+    return failures
+
+def worker_count(value):
+    """argparse 的 --jobs 类型：大于等于 0 的整数，0 = CPU 核数"""
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"需要整数，收到 '{value}'")
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"不能小于 0，收到 {count}")
+    return count or os.cpu_count() or 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 Telegram 的 .webp 贴纸按真实格式整理：WebM 转 GIF，WebP 图片移动到 output")
+    parser.add_argument("folder", nargs='?', default=None, help="输入文件夹（默认当前目录）")
+    parser.add_argument("-j", "--jobs", type=worker_count, default=None, help="每个阶段的并发进程数（0 或默认 = CPU 核数）")
+    parser.add_argument("--metrics", metavar="PATH", help="把每个文件各阶段的耗时以 JSON lines 追加写入 PATH（- 表示 stderr）")
+    args = parser.parse_args()
+    configure_metrics(args.metrics)
 
-convert_webp_to_correct_format()
+    if convert_webp_to_correct_format(args.folder, args.jobs):
+        sys.exit(1)
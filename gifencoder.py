@@ -0,0 +1,241 @@
+"""Streaming GIF writer shared by gifframeinsert and background_remover.
+
+Pillow's save(save_all=True) collects every frame in memory before it
+writes the first byte. GifWriter instead writes the header with the first
+frame and then one image block per frame, holding back only the latest
+frame so an identical successor can extend its duration. Like Pillow, only
+the box that changed since the previous frame is written, with the pixels
+that stayed the same made transparent.
+
+Frames are either quantized one by one to their own adaptive palette, as
+Pillow does, or mapped onto one shared palette (see FrameEncoder).
+"""
+from PIL import GifImagePlugin, Image, ImageChops, ImageSequence
+
+# Palette slot reserved for fully transparent pixels
+TRANSPARENT_INDEX = 255
+
+def exact_palette(frames, colors=255):
+    """Flat RGB palette of every color in frames, or None if there are more than `colors`."""
+    seen = set()
+    for frame in frames:
+        used = frame.convert('RGB').getcolors(colors)
+        if used is None:
+            return None
+        seen.update(color for _, color in used)
+        if len(seen) > colors:
+            return None
+    return [channel for color in sorted(seen) for channel in color]
+
+def source_palette(im, colors=255):
+    """Exact palette of every color in a GIF, or None if it has more than `colors`.
+
+    Decodes each frame once and leaves im on its first frame. Output pixels
+    that keep a source color are encoded exactly, others are mapped to the
+    nearest entry; for None callers should let each frame get its own
+    palette instead.
+    """
+    try:
+        return exact_palette(ImageSequence.Iterator(im), colors)
+    finally:
+        im.seek(0)
+
+def difference_box(difference):
+    """Bounding box of the nonzero pixels of an RGBA difference image."""
+    try:
+        return difference.getbbox(alpha_only=False)
+    except TypeError:  # Pillow < 10 always looks at every band
+        return difference.getbbox()
+
+def changed_box(previous, frame):
+    """Bounding box of the pixels that differ between two RGBA frames."""
+    return difference_box(ImageChops.difference(frame, previous))
+
+def unchanged_mask(difference):
+    """Mode "1" mask of the zero pixels of an RGBA difference image."""
+    largest = difference.getchannel(0)
+    for band in range(1, 4):
+        largest = ImageChops.lighter(largest, difference.getchannel(band))
+    return largest.point(lambda value: 255 if value == 0 else 0, '1')
+
+def transparent_mask(region):
+    """Mode "1" mask of the fully transparent pixels; GIF has no partial alpha."""
+    return region.getchannel('A').point(lambda a: 255 if a == 0 else 0, '1')
+
+def palette_image(palette):
+    """A "P" image carrying palette, for Image.quantize(palette=...)."""
+    image = Image.new('P', (1, 1))
+    image.putpalette(palette)
+    return image
+
+class FrameEncoder:
+    """Turn RGBA frames into "P" frames on a shared palette, one delta at a time."""
+
+    def __init__(self, palette):
+        # At most 255 colors, the last slot is kept for transparency
+        self.palette_image = palette_image(palette[:TRANSPARENT_INDEX * 3])
+        # Full palette for the output frames, the transparent slot included
+        self.palette = self.palette_image.getpalette()
+        self.palette += [0] * (256 * 3 - len(self.palette))
+        self.previous_rgba = None
+        self.previous_indexed = None
+
+    def quantize(self, region):
+        indexed = region.convert('RGB').quantize(palette=self.palette_image, dither=Image.Dither.NONE)
+        indexed.paste(TRANSPARENT_INDEX, mask=transparent_mask(region))
+        return indexed
+
+    def encode(self, frame):
+        duration = frame.info.get('duration')
+        frame = frame.convert('RGBA')
+        if self.previous_rgba is None or self.previous_rgba.size != frame.size:
+            indexed = self.quantize(frame)
+        else:
+            box = changed_box(self.previous_rgba, frame)
+            indexed = self.previous_indexed.copy()
+            if box is not None:
+                # Only the changed region goes through the quantizer again
+                indexed.paste(self.quantize(frame.crop(box)), box[:2])
+        indexed.putpalette(self.palette)
+        indexed.info.pop('duration', None)
+        if duration is not None:
+            indexed.info['duration'] = duration
+        self.previous_rgba, self.previous_indexed = frame, indexed
+        return indexed
+
+def adaptive_quantize(region):
+    """Quantize an RGBA region to its own palette, like Pillow's GIF writer.
+
+    The palette is cut down to the colors in use. Fully transparent pixels,
+    and only those, share one transparent entry. Returns the "P" image and
+    the index of that entry, or None.
+    """
+    transparent = transparent_mask(region)
+    if transparent.getbbox() is None:
+        indexed = region.convert('P', palette=Image.Palette.ADAPTIVE)
+        return indexed.remap_palette(sorted(index for _, index in indexed.getcolors(256))), None
+    # The quantizer can fold alpha 0 into a barely visible entry, so keep a
+    # slot free and mark the transparent pixels ourselves
+    indexed = region.convert('P', palette=Image.Palette.ADAPTIVE, colors=255)
+    indexed = indexed.remap_palette(sorted(index for _, index in indexed.getcolors(256)))
+    indexed.putpalette(indexed.getpalette('RGB'))
+    transparency = len(indexed.getpalette()) // 3  # past the palette, at most 255
+    indexed.paste(transparency, mask=transparent)
+    return indexed, transparency
+
+def spare_index(indexed):
+    """An index no pixel of a "P" image uses, for transparency, or None.
+
+    Like Pillow, this is the first index past the palette, which does not
+    grow the color table; with a full palette it is an unused entry.
+    """
+    mode = indexed.palette.mode
+    special = (indexed.info.get('background'), indexed.info.get('transparency'))
+    index = len(indexed.getpalette(mode)) // len(mode)
+    while index in special:
+        index += 1
+    if index < 256:
+        return index
+    unused = [index for index, count in enumerate(indexed.histogram()) if count == 0 and index not in special]
+    return unused[-1] if unused else None
+
+class GifWriter:
+    """Write an animated GIF to a binary file one frame at a time.
+
+    With a palette every frame is mapped onto it and the header's global
+    color table is used throughout; without one each frame's changed box
+    gets its own local color table. disposal applies to every frame; with
+    disposal=2 the canvas is cleared after each frame, so each frame is
+    written over its own visible pixels instead of its difference.
+    """
+
+    def __init__(self, fp, palette=None, loop=0, disposal=0):
+        self.fp = fp
+        self.encoder = FrameEncoder(palette) if palette is not None else None
+        self.loop = loop
+        self.disposal = disposal
+        self.previous = None  # last frame as viewers show it, RGBA
+        self.held = None  # [indexed, offset, duration, transparency] not yet written
+        self.started = False
+
+    def add(self, frame):
+        duration = frame.info.get('duration', 0)
+        frame = frame.convert('RGBA')
+        if self.previous is not None and frame.size != self.previous.size:
+            raise ValueError(f"frame size {frame.size} differs from {self.previous.size}")
+        if self.encoder is not None:
+            indexed, transparency = self.encoder.encode(frame), TRANSPARENT_INDEX
+        else:
+            indexed, transparency = adaptive_quantize(frame)
+        # Compare what viewers will show, not the source pixels. Converting
+        # with transparency set puts alpha into the palette, so use a copy
+        shown = indexed.copy()
+        shown.info.pop('transparency', None)
+        if transparency is not None:
+            shown.info['transparency'] = transparency
+        shown = shown.convert('RGBA')
+        box = (0, 0) + frame.size
+        if self.previous is not None:
+            difference = ImageChops.difference(shown, self.previous)
+            box = difference_box(difference)
+            if box is None:
+                # Same picture again: show the held frame longer instead
+                self.held[2] += duration
+                return
+            if self.disposal == 2:
+                # The canvas is blank again, redraw everything that is visible
+                box = shown.getchannel('A').getbbox() or (0, 0, 1, 1)
+        indexed = indexed.crop(box)
+        if self.previous is not None and self.disposal != 2:
+            # Pixels that did not change are left to show through, which
+            # compresses better
+            if transparency is None:
+                transparency = spare_index(indexed)
+            if transparency is not None:
+                indexed.paste(transparency, mask=unchanged_mask(difference.crop(box)))
+        self.previous = shown
+        self.flush()
+        self.held = [indexed, box[:2], duration, transparency]
+
+    def flush(self):
+        if self.held is None:
+            return
+        indexed, offset, duration, transparency = self.held
+        self.held = None
+        params = {'disposal': self.disposal}
+        if duration:
+            params['duration'] = duration
+        if transparency is not None:
+            params['transparency'] = transparency
+        if not self.started:
+            # The first frame covers the canvas and supplies the global color table
+            header, _ = GifImagePlugin.getheader(indexed, info={'loop': self.loop})
+            self.fp.write(b''.join(header))
+            self.started = True
+        else:
+            params['include_color_table'] = self.encoder is None
+        data = GifImagePlugin.getdata(indexed, offset, **params)
+        self.fp.write(b''.join(data))
+        # getdata collects into a class made per call, which only a full
+        # garbage collection frees; empty it so the bytes go right away
+        data.clear()
+
+    def close(self):
+        self.flush()
+        if not self.started:
+            raise ValueError("no frames to write")
+        self.fp.write(b';')
+
+def save_gif(output_path, frames, palette=None, loop=0, disposal=0):
+    """Write an iterable of RGBA frames as an animated GIF, one frame at a time.
+
+    palette is a flat RGB list shared by every frame, e.g. from
+    source_palette; without it each frame is quantized on its own. Each
+    frame's info['duration'] is kept. Memory stays at two frames no matter
+    how long the animation is.
+    """
+    with open(output_path, 'wb') as fp:
+        writer = GifWriter(fp, palette, loop, disposal)
+        for frame in frames:
+            writer.add(frame)
+        writer.close()
@@ -1,29 +1,216 @@
 from PIL import Image, ImageSequence
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
 import sys
+import time
+
+import gifencoder
+from metrics import Record, configure_metrics
+
+try:
+    import numpy as np
+except ImportError:
+    # Only needed for --mode motion
+    np = None
+
+MODES = ('blend', 'motion')
+
+def luma(pixels):
+    # Integer luminance of an RGBA array, good enough for block matching
+    return (pixels[..., 0] * 299 + pixels[..., 1] * 587 + pixels[..., 2] * 114) // 1000
+
+def estimate_motion(gray_a, gray_b, block=8, radius=4):
+    # Block matching: for every block of frame b find the offset (dy, dx) into
+    # frame a with the smallest sum of absolute differences, so that
+    # b[p] ~ a[p + offset]. Offsets are tried nearest first, so ties keep the
+    # smallest motion.
+    height, width = gray_b.shape
+    rows, cols = -(-height // block), -(-width // block)
+    padded_h, padded_w = rows * block, cols * block
+    b = np.pad(gray_b, ((0, padded_h - height), (0, padded_w - width)), mode='edge').astype(np.int32)
+    a = np.pad(gray_a, ((radius, padded_h - height + radius), (radius, padded_w - width + radius)),
+               mode='edge').astype(np.int32)
+    offsets = sorted(((dy, dx) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)),
+                     key=lambda offset: abs(offset[0]) + abs(offset[1]))
+    best = np.full((rows, cols), np.iinfo(np.int64).max, dtype=np.int64)
+    vectors = np.zeros((rows, cols, 2), dtype=np.int32)
+    for dy, dx in offsets:
+        shifted = a[radius + dy:radius + dy + padded_h, radius + dx:radius + dx + padded_w]
+        sad = np.abs(shifted - b).reshape(rows, block, cols, block).sum(axis=(1, 3))
+        better = sad < best
+        best[better] = sad[better]
+        vectors[better] = (dy, dx)
+    return vectors
+
+def motion_pair(pixels_a, pixels_b, factor, block=8, radius=4):
+    # Motion-compensated in-between frames for two RGBA arrays. A pixel at p
+    # in the frame at time t comes from a[p + t*d] and b[p - (1-t)*d], blended
+    # with the same arithmetic as Image.blend.
+    height, width = pixels_b.shape[:2]
+    vectors = estimate_motion(luma(pixels_a.astype(np.int32)), luma(pixels_b.astype(np.int32)),
+                              block, radius)
+    field = np.repeat(np.repeat(vectors, block, axis=0), block, axis=1)[:height, :width]
+    rows, cols = np.indices((height, width))
+    results = []
+    for j in range(1, factor):
+        t = j / factor
+        rows_a = np.clip(rows + np.rint(t * field[..., 0]).astype(np.intp), 0, height - 1)
+        cols_a = np.clip(cols + np.rint(t * field[..., 1]).astype(np.intp), 0, width - 1)
+        rows_b = np.clip(rows - np.rint((1 - t) * field[..., 0]).astype(np.intp), 0, height - 1)
+        cols_b = np.clip(cols - np.rint((1 - t) * field[..., 1]).astype(np.intp), 0, width - 1)
+        a = pixels_a[rows_a, cols_a].astype(np.float32)
+        b = pixels_b[rows_b, cols_b].astype(np.float32)
+        results.append((a + np.float32(t) * (b - a)).astype(np.uint8))
+    return results
+
+def interpolate(frame_a, frame_b, factor, mode='blend', block=8, radius=4):
+    # The factor-1 in-between frames of two RGBA frames
+    if mode == 'motion':
+        return motion_pair(np.asarray(frame_a), np.asarray(frame_b), factor, block, radius)
+    return [Image.blend(frame_a, frame_b, j / factor) for j in range(1, factor)]
+
+def iter_interpolated_frames(frames, factor, mode='blend', workers=1, block=8, radius=4):
+    # Yield every source frame followed by its interpolated frames. Each source
+    # frame's duration is split evenly over itself and the frames after it.
+    # Without a pool only two source frames and one chunk of in-between frames
+    # are alive; with one, at most 2*workers frame pairs are in flight.
+    executor = None
+    if mode == 'motion' and workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    max_in_flight = workers * 2 if executor else 0
+    pending = deque()
+
+    def flush():
+        source, job = pending.popleft()
+        yield source
+        for interpolated_frame in (job.result() if executor else job):
+            if not isinstance(interpolated_frame, Image.Image):
+                interpolated_frame = Image.fromarray(interpolated_frame)
+            interpolated_frame.info['duration'] = source.info['duration']
+            yield interpolated_frame
+
+    try:
+        previous = None
+        for frame in frames:
+            duration = frame.info.get('duration', 100) // factor
+            # ImageSequence.Iterator reuses one image object, so take a copy
+            frame = frame.convert('RGBA')
+            frame.info['duration'] = duration
+            if previous is not None:
+                if executor:
+                    job = executor.submit(motion_pair, np.asarray(previous), np.asarray(frame),
+                                          factor, block, radius)
+                else:
+                    job = interpolate(previous, frame, factor, mode, block, radius)
+                pending.append((previous, job))
+                while len(pending) > max_in_flight:
+                    yield from flush()
+            previous = frame
+        while pending:
+            yield from flush()
+        if previous is not None:
+            yield previous
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+def iter_decoded_frames(image):
+    # Decode each frame as the iterator reaches it instead of on first use
+    for frame in ImageSequence.Iterator(image):
+        frame.load()
+        yield frame
+
+def iter_palette_sample(image, factor, sample_size=8, sample_edge=256):
+    # Source frames spread evenly over the whole animation, each followed by
+    # its cross-fades towards the next frame. Frames are shrunk first, so
+    # this costs one extra decode and little memory.
+    step = max(1, image.n_frames // sample_size)
+    previous = None
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if previous is None and index % step:
+            continue
+        frame = frame.convert('RGBA')
+        frame.thumbnail((sample_edge, sample_edge), Image.Resampling.NEAREST)
+        if previous is not None:
+            yield from interpolate(previous, frame, factor)
+            previous = None
+        if index % step == 0:
+            yield frame
+            previous = frame
+
+def sample_palette(image, factor):
+    # Shared palette for --fast-gif, None as soon as the sample needs more
+    # than one palette. Leaves image on its first frame.
+    try:
+        return gifencoder.exact_palette(iter_palette_sample(image, factor))
+    finally:
+        image.seek(0)
+
+def insert_frames(input_path, output_path, factor=2, mode='blend', workers=1, block=8, radius=4,
+                  fast_gif=False):
+    record = Record('gifframeinsert.insert_frames', input=input_path, mode=mode, factor=factor)
+    record.count('bytes_in', os.path.getsize(input_path))
 
-def insert_frames(input_path, output_path, factor=2):
     # Read GIF file
     original_gif = Image.open(input_path)
-    frames = [frame.convert('RGBA') for frame in ImageSequence.Iterator(original_gif)]
-    
-    # Insert frames
-    new_frames = []
-    for i in range(len(frames) - 1):
-        new_frames.append(frames[i])
-        for j in range(1, factor):
-            alpha = j / factor
-            interpolated_frame = Image.blend(frames[i], frames[i + 1], alpha)
-            new_frames.append(interpolated_frame)
-    new_frames.append(frames[-1])
-    
-    # Save new GIF
-    new_frames[0].save(output_path, save_all=True, append_images=new_frames[1:], loop=0, duration=original_gif.info['duration'] // factor)
+    palette = None
+    if fast_gif:
+        with record.stage('palette'):
+            # Too many colors: fall back to a palette per frame
+            palette = sample_palette(original_gif, factor)
+
+    # Insert frames lazily, the GIF writer pulls them from the generator
+    source_frames = record.iter('decode', iter_decoded_frames(original_gif), counter='frames_in')
+    new_frames = iter_interpolated_frames(source_frames, factor, mode, workers, block, radius)
+    new_frames = record.iter('interpolate', new_frames, counter='frames')
+
+    # Save new GIF frame by frame, every frame carries its own duration
+    with record.stage('save'):
+        gifencoder.save_gif(output_path, new_frames, palette)
+    record.count('bytes_out', os.path.getsize(output_path))
+    record.close(output=output_path)
+
+def worker_count(value):
+    # argparse type for --workers: an integer >= 0, 0 = one per CPU
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a whole number, got '{value}'")
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {count}")
+    return count or os.cpu_count() or 1
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python script.py input.gif output.gif factor")
-    else:
-        input_path = sys.argv[1]
-        output_path = sys.argv[2]
-        factor = int(sys.argv[3])
-        insert_frames(input_path, output_path, factor)
+    parser = argparse.ArgumentParser(description="Insert interpolated frames into a GIF")
+    parser.add_argument("input_path", help="input GIF")
+    parser.add_argument("output_path", help="output GIF")
+    parser.add_argument("factor", type=int, help="output frames per input frame")
+    parser.add_argument("--mode", choices=MODES, default='blend',
+                        help="blend: cross-fade (default); motion: block-matching motion compensation")
+    parser.add_argument("--workers", type=worker_count, default=1,
+                        help="processes for --mode motion (0 = one per CPU)")
+    parser.add_argument("--block", type=int, default=8, help="block size for --mode motion")
+    parser.add_argument("--radius", type=int, default=4, help="motion search radius in pixels")
+    parser.add_argument("--fast-gif", action="store_true",
+                        help="encode on one shared palette when frames sampled across the animation "
+                             "use at most 255 colors; colors missed by the sample are approximated")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="append stage timings as JSON lines to PATH ('-' for stderr)")
+    args = parser.parse_args()
+    configure_metrics(args.metrics)
+
+    if args.mode == 'motion' and np is None:
+        sys.exit("--mode motion requires NumPy (pip install numpy)")
+
+    start = time.perf_counter()
+    insert_frames(args.input_path, args.output_path, args.factor, args.mode, args.workers,
+                  args.block, args.radius, args.fast_gif)
+    elapsed = time.perf_counter() - start
+
+    # Report throughput and size so the two modes can be compared
+    source_frames = Image.open(args.input_path).n_frames
+    frame_count = source_frames + (source_frames - 1) * (args.factor - 1)
+    print(f"{frame_count} frames in {elapsed:.2f}s ({frame_count / elapsed:.1f} frames/s), "
+          f"{os.path.getsize(args.output_path) / 1024:.1f} KB")
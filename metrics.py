@@ -0,0 +1,153 @@
+"""Stage timers and counters shared by the scripts in this repository.
+
+A Record collects what happened while one unit of work ran (one image, one
+export, one folder):
+
+    record = Record('background_remover.process_image', input=path)
+    with record.stage('detect'):
+        color = get_background_color(image)
+    for frame in record.iter('process', frames, counter='frames'):
+        ...
+    record.count('bytes_out', os.path.getsize(output_path))
+    record.close()
+
+Stages are exclusive: time spent in a nested stage, or pulling items through
+record.iter() inside another stage, is not counted again in the outer one,
+so the stage times of a record add up to at most its elapsed time. Time
+handed in with add_time() is the exception: work done in parallel by a pool
+can add up to more than the wall clock.
+
+close() appends the record as one JSON line to the file named by the
+MYPYTHONSCRIPT_METRICS environment variable ('-' for stderr). Without it
+nothing is written. Child processes inherit the variable, so records from
+process pools land in the same file; each line is a single append.
+
+    python metrics.py run.jsonl   # total time per stage, hottest first
+"""
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_ENV = 'MYPYTHONSCRIPT_METRICS'
+
+def configure_metrics(path):
+    """Send records of this process and its future children to path ('-' for stderr)."""
+    if path:
+        os.environ[METRICS_ENV] = path
+
+def emit(entry):
+    path = os.environ.get(METRICS_ENV)
+    if not path:
+        return
+    line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+    if path == '-':
+        sys.stderr.write(line)
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+class Record:
+    """Exclusive stage times and counters for one unit of work. Not thread-safe."""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self._active = []  # [stage name, start, time spent in nested stages]
+
+    def _enter(self, name):
+        self._active.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        name, start, nested = self._active.pop()
+        elapsed = time.perf_counter() - start
+        self.stages[name] += elapsed - nested
+        if self._active:
+            self._active[-1][2] += elapsed
+
+    def add_time(self, name, seconds):
+        """Add time measured elsewhere, e.g. by a worker thread, to a stage."""
+        self.stages[name] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        self._enter(name)
+        try:
+            yield self
+        finally:
+            self._exit()
+
+    def iter(self, name, iterable, counter=None):
+        """Yield from iterable, timing only the work done to produce each item."""
+        iterator = iter(iterable)
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            if counter:
+                self.counters[counter] += 1
+            yield item
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def as_dict(self):
+        entry = {'name': self.name, 'pid': os.getpid(), 'time': time.time()}
+        entry.update(self.fields)
+        entry['elapsed'] = round(self.elapsed if self.elapsed is not None else time.perf_counter() - self.start, 6)
+        entry['stages'] = {name: round(seconds, 6) for name, seconds in self.stages.items()}
+        entry['counters'] = dict(self.counters)
+        return entry
+
+    def close(self, **fields):
+        """Stop the clock and emit the record. Fields are added to the JSON line."""
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.start
+            self.fields.update(fields)
+            emit(self.as_dict())
+        return self
+
+def summarize(lines):
+    """Total elapsed time, stage times and counters per record name."""
+    totals = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        total = totals.setdefault(entry['name'], {'records': 0, 'elapsed': 0.0,
+                                                  'stages': defaultdict(float), 'counters': defaultdict(int)})
+        total['records'] += 1
+        total['elapsed'] += entry['elapsed']
+        for name, seconds in entry['stages'].items():
+            total['stages'][name] += seconds
+        for name, amount in entry['counters'].items():
+            total['counters'][name] += amount
+    return totals
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: python {os.path.basename(sys.argv[0])} <metrics.jsonl>")
+        return 1
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        totals = summarize(f)
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]['elapsed']):
+        print(f"{name}: {total['records']} records, {total['elapsed']:.3f}s")
+        for stage, seconds in sorted(total['stages'].items(), key=lambda item: -item[1]):
+            share = seconds / total['elapsed'] * 100 if total['elapsed'] else 0
+            print(f"  {stage:<20} {seconds:10.3f}s  {share:5.1f}%")
+        for counter, amount in sorted(total['counters'].items()):
+            print(f"  {counter:<20} {amount:>11,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,423 @@
 import json
 import base64
+import hashlib
 import os
 import argparse
 import glob
+import re
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+from itertools import repeat
 
-def parse_ai_studio_json(json_file_path, output_image_dir):
+from metrics import Record, configure_metrics
+
+STREAM_BLOCK = 64 * 1024  # 流式模式每次读取的字符数
+WHITESPACE = re.compile(r'[ \t\r\n]*')
+STRING_SPECIAL = re.compile(r'["\\]')
+SCALAR_END = re.compile(r'[\s,\]\}]')
+BASE64_JUNK = re.compile(r'[^A-Za-z0-9+/=]')
+IMAGE_KEYS = ('inline_data', 'inlineData')
+IMAGE_EXTS = ('png', 'jpg')  # 只会保存这两种扩展名
+_stores = {}  # 每个进程按输出目录缓存一个 ImageStore
+
+def iter_json_events(f, block_size=STREAM_BLOCK):
+    """
+    增量 JSON 解析器，逐个产出 (事件, 值)
+    字符串值拆成 start_string / string (片段) / end_string，再长的字符串也只占一个块的内存
+    """
+    buf = ''
+    pos = 0
+    stack = []  # True 表示对象，False 表示数组
+    expect_key = False
+
+    def ensure(n):
+        # 保证缓冲区还有 n 个未读字符，文件读完时返回 False
+        nonlocal buf, pos
+        while len(buf) - pos < n:
+            block = f.read(block_size)
+            if not block:
+                return False
+            buf = buf[pos:] + block
+            pos = 0
+        return True
+
+    def read_string():
+        nonlocal pos
+        while True:
+            match = STRING_SPECIAL.search(buf, pos)
+            if match is None:
+                if pos < len(buf):
+                    yield buf[pos:]
+                    pos = len(buf)
+                if not ensure(1):
+                    raise ValueError("字符串没有结束")
+                continue
+            if match.start() > pos:
+                yield buf[pos:match.start()]
+            pos = match.start()
+            if buf[pos] == '"':
+                pos += 1
+                return
+            # 转义序列，\uD83D\uDE00 这样的代理对要一起解码
+            ensure(12)
+            length = 2
+            if buf[pos + 1:pos + 2] == 'u':
+                length = 6
+                if buf[pos + 2:pos + 4].lower() in ('d8', 'd9', 'da', 'db') and buf[pos + 6:pos + 8] == '\\u':
+                    length = 12
+            yield json.loads('"' + buf[pos:pos + length] + '"')
+            pos += length
+
+    while ensure(1):
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            continue
+        char = buf[pos]
+        pos += 1
+        if char == '{':
+            stack.append(True)
+            expect_key = True
+            yield 'start_map', None
+        elif char == '[':
+            stack.append(False)
+            yield 'start_array', None
+        elif char in '}]':
+            if not stack or stack.pop() != (char == '}'):
+                raise ValueError(f"多余的 '{char}'")
+            expect_key = False
+            yield ('end_map' if char == '}' else 'end_array'), None
+        elif char == ',':
+            expect_key = bool(stack) and stack[-1]
+        elif char == ':':
+            expect_key = False
+        elif char == '"':
+            if expect_key:
+                yield 'key', ''.join(read_string())
+            else:
+                yield 'start_string', None
+                for piece in read_string():
+                    yield 'string', piece
+                yield 'end_string', None
+        else:
+            # 数字、true、false、null
+            pos -= 1
+            while True:
+                match = SCALAR_END.search(buf, pos)
+                if match or not ensure(len(buf) - pos + 1):
+                    break
+            end = match.start() if match else len(buf)
+            token = buf[pos:end]
+            pos = end
+            yield 'value', json.loads(token)
+    if stack:
+        raise ValueError("JSON 不完整")
+
+class Base64Writer:
+    """
+    把分块到达的 base64 文本边解码边写入文件
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.pending = ''
+        self.received = 0
+        self.written = 0  # 解码后写入的字节数
+        # 顺便计算 base64 文本和解码后内容的 sha256，供去重仓库使用
+        self.payload_hash = hashlib.sha256()
+        self.image_hash = hashlib.sha256()
+
+    def write(self, text):
+        self.received += len(text)
+        self.payload_hash.update(text.encode('utf-8'))
+        # 和 b64decode 一样忽略字母表以外的字符，每次只解码完整的 4 字符组
+        text = self.pending + BASE64_JUNK.sub('', text)
+        cut = len(text) - len(text) % 4
+        self.output(base64.b64decode(text[:cut]))
+        self.pending = text[cut:]
+
+    def output(self, image_bytes):
+        self.written += len(image_bytes)
+        self.image_hash.update(image_bytes)
+        self.file.write(image_bytes)
+
+    def close(self):
+        try:
+            self.output(base64.b64decode(self.pending))
+        finally:
+            self.file.close()
+
+class ImageStore:
+    """
+    按内容寻址的图片仓库，相同的图片只存一份 blobs/ab/<sha256>.<ext>，扩展名以第一次保存时为准
+    index.jsonl 记录 base64 文本的 sha256 -> blob，重复运行时命中就不再解码（流式模式要读完才知道，仍会解码）
+    manifest.jsonl 记录 原图片名 -> blob；hardlink=True 时还会在输出目录建硬链接
+    两个文件都只追加，多个进程可以同时写，同一个键以最后一行为准
+    """
+    def __init__(self, output_dir, hardlink=False):
+        self.output_dir = output_dir
+        self.hardlink = hardlink
+        self.index_path = os.path.join(output_dir, 'index.jsonl')
+        self.manifest_path = os.path.join(output_dir, 'manifest.jsonl')
+        self.index = self.load(self.index_path, 'payload')
+        self.manifest = self.load(self.manifest_path, 'name')
+        self.claimed = {}  # 图片 sha256 -> blob，写盘线程同时存同一张图时只写一份
+        self.lock = threading.Lock()
+
+    def load(self, path, key):
+        entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry[key]] = entry['blob']
+                    except (ValueError, KeyError, TypeError):
+                        pass  # 被中断的半行
+        return entries
+
+    def append(self, path, entry):
+        # 一行一次 write，O_APPEND 下多个进程同时追加也不会交错
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def lookup(self, payload_digest):
+        blob = self.index.get(payload_digest)
+        if blob and os.path.exists(os.path.join(self.output_dir, blob)):
+            return blob
+        return None
+
+    def blob_path(self, image_digest, ext):
+        # 返回 (blob, 路径, 是否已存在或已有线程在写)；同样的内容换了扩展名也用已有的那份
+        with self.lock:
+            blob = self.claimed.get(image_digest)
+            if blob is None:
+                for known_ext in IMAGE_EXTS:
+                    candidate = f"blobs/{image_digest[:2]}/{image_digest}.{known_ext}"
+                    if os.path.exists(os.path.join(self.output_dir, candidate)):
+                        blob = candidate
+                        break
+            exists = blob is not None
+            if not exists:
+                blob = f"blobs/{image_digest[:2]}/{image_digest}.{ext}"
+                os.makedirs(os.path.join(self.output_dir, os.path.dirname(blob)), exist_ok=True)
+            self.claimed[image_digest] = blob
+        return blob, os.path.join(self.output_dir, blob), exists
+
+    def put(self, payload_digest, image_bytes, ext):
+        # 存入解码后的图片，返回 (blob, 是否新写入)
+        blob, path, exists = self.blob_path(hashlib.sha256(image_bytes).hexdigest(), ext)
+        is_new = not exists
+        if is_new:
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            write_image(temp_path, image_bytes)
+            os.replace(temp_path, path)
+        self.remember(payload_digest, blob)
+        return blob, is_new
+
+    def adopt(self, payload_digest, image_digest, temp_path, ext):
+        # 流式模式下图片已写到临时文件，移入仓库或在重复时删掉
+        blob, path, exists = self.blob_path(image_digest, ext)
+        is_new = not exists
+        if is_new:
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+        self.remember(payload_digest, blob)
+        return blob, is_new
+
+    def remember(self, payload_digest, blob):
+        if self.index.get(payload_digest) != blob:
+            self.index[payload_digest] = blob
+            self.append(self.index_path, {'payload': payload_digest, 'blob': blob})
+
+    def link(self, out_name, blob, source):
+        if self.manifest.get(out_name) != blob:
+            self.manifest[out_name] = blob
+            self.append(self.manifest_path, {'name': out_name, 'blob': blob, 'source': source})
+        if self.hardlink:
+            out_path = os.path.join(self.output_dir, out_name)
+            if os.path.exists(out_path) and os.path.samefile(out_path, os.path.join(self.output_dir, blob)):
+                return
+            temp_path = f"{out_path}.{os.getpid()}.tmp"
+            os.link(os.path.join(self.output_dir, blob), temp_path)
+            os.replace(temp_path, out_path)
+
+def get_store(output_dir, hardlink=False):
+    if output_dir not in _stores:
+        _stores[output_dir] = ImageStore(output_dir, hardlink)
+    return _stores[output_dir]
+
+def report_image(out_name, is_new=True):
+    if is_new:
+        print(f"   └── 🖼️  保存图片: {out_name}")
+    else:
+        print(f"   └── ♻️  重复图片: {out_name}")
+
+def image_location(path, chunks_path):
+    # path 指向 inlineImage 或 parts[k].inline_data/inlineData 时返回 True
+    n = len(chunks_path)
+    if path[:n] != chunks_path or len(path) <= n or not isinstance(path[n], int):
+        return False
+    rest = path[n + 1:]
+    if rest == ['inlineImage']:
+        return True
+    return len(rest) == 3 and rest[0] == 'parts' and isinstance(rest[1], int) and rest[2] in IMAGE_KEYS
+
+def stream_ai_studio_json(json_file_path, output_image_dir, block_size=STREAM_BLOCK, store=None, record=None):
     """
-    解析单个 AI Studio JSON 文件
+    流式解析单个 AI Studio JSON 文件，base64 图片按块解码写盘，内存占用与文件大小无关
     """
+    record = record or Record('parse_aistudio.stream_ai_studio_json')
+    safe_basename = os.path.splitext(os.path.basename(json_file_path))[0]
+    path = []  # 当前位置：对象里是键，数组里是下标
+    chunks_path = None  # 实际采用的对话列表
+    image = None  # 正在读取的图片对象
+    field = None  # 图片对象里正在读取的字符串字段
+    image_count = 0
+
+    def finish_image():
+        nonlocal image_count
+        writer = image['writer']
+        if writer is None:
+            return
+        mime = ''.join(image['mime']) if image['mime'] is not None else 'image/jpeg'
+        if image['ok'] and writer.received:
+            ext = 'png' if 'png' in mime.lower() else 'jpg'
+            # 文件名：原文件名_img_序号.jpg
+            out_name = f"{safe_basename}_img_{image['index']}_{image_count}.{ext}"
+            with record.stage('store'):
+                if store:
+                    blob, is_new = store.adopt(writer.payload_hash.hexdigest(), writer.image_hash.hexdigest(),
+                                               image['temp_path'], ext)
+                    store.link(out_name, blob, json_file_path)
+                else:
+                    os.replace(image['temp_path'], os.path.join(output_image_dir, out_name))
+                    is_new = True
+            record.count('images')
+            record.count('bytes_out', writer.written)
+            if not is_new:
+                record.count('duplicates')
+            report_image(out_name, is_new)
+            image_count += 1
+        else:
+            os.remove(image['temp_path'])
+
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as f, record.stage('parse'):
+            for event, value in iter_json_events(f, block_size):
+                if event == 'key':
+                    path[-1] = value
+                    continue
+                if event == 'string':
+                    if field == 'data':
+                        try:
+                            with record.stage('decode'):
+                                image['writer'].write(value)
+                        except Exception:
+                            image['ok'] = False
+                    elif field == 'mimeType':
+                        image['mime'].append(value)
+                    continue
+                if event == 'end_string':
+                    if field == 'data':
+                        try:
+                            with record.stage('decode'):
+                                image['writer'].close()
+                        except Exception:
+                            image['ok'] = False
+                    field = None
+                    continue
+                if event in ('end_map', 'end_array'):
+                    if image is not None and len(path) == image['depth']:
+                        finish_image()
+                        image = None
+                    path.pop()
+                    continue
+
+                # 一个新值开始，数组里的下标加一
+                if path and isinstance(path[-1], int):
+                    path[-1] += 1
+                    # 兼容两种结构，先遇到的非空对话列表为准
+                    if chunks_path is None and path[:-1] in (['chunkedPrompt', 'chunks'], ['contents']):
+                        chunks_path = path[:-1]
+                        print(f"🚀 正在处理: {os.path.basename(json_file_path)}")
+                if event == 'start_map':
+                    if image is None and chunks_path is not None and image_location(path, chunks_path):
+                        image = {'depth': len(path) + 1, 'index': path[len(chunks_path)],
+                                 'writer': None, 'mime': None, 'ok': True,
+                                 'temp_path': os.path.join(output_image_dir, f".{safe_basename}_{os.getpid()}.part")}
+                    path.append(None)
+                elif event == 'start_array':
+                    path.append(-1)
+                elif event == 'start_string' and image is not None and len(path) == image['depth']:
+                    if path[-1] == 'data' and image['writer'] is None:
+                        field = 'data'
+                        image['writer'] = Base64Writer(image['temp_path'])
+                    elif path[-1] == 'mimeType':
+                        field = 'mimeType'
+                        image['mime'] = []
+    except Exception as e:
+        if image is not None and image['writer'] is not None:
+            image['writer'].file.close()
+            os.remove(image['temp_path'])
+        print(f"❌ 读取错误 ({json_file_path}): {e}")
+        return 0
+
+    if chunks_path is None:
+        print(f"⚠️  跳过：{os.path.basename(json_file_path)} (未找到对话数据)")
+        return 0
+
+    if image_count == 0:
+        print("   └── (无图片)")
+    else:
+        print(f"   └── ✅ 提取了 {image_count} 张图片")
+    print("-" * 40)
+    return image_count
+
+def write_image(out_path, image_bytes):
+    with open(out_path, "wb") as f:
+        f.write(image_bytes)
+
+def save_image(out_path, image_bytes, store=None, payload_digest=None, ext=None):
+    # 返回 (blob, 是否新写入)，不去重时 blob 为 None
+    if store:
+        return store.put(payload_digest, image_bytes, ext)
+    write_image(out_path, image_bytes)
+    return None, True
+
+def parse_ai_studio_json(json_file_path, output_image_dir, stream=False, write_threads=1, store=None):
+    """
+    解析单个 AI Studio JSON 文件，返回提取的图片数
+    write_threads > 1 时图片由线程池写盘（流式模式边解码边写，不使用线程池）
+    store 为 ImageStore 时按内容去重保存
+    """
+    record = Record('parse_aistudio.parse_ai_studio_json', input=json_file_path, stream=stream)
+    image_count = 0
+    try:
+        image_count = _parse_ai_studio_json(json_file_path, output_image_dir, stream, write_threads, store, record)
+        return image_count
+    finally:
+        record.close(images=image_count)
+
+def _parse_ai_studio_json(json_file_path, output_image_dir, stream, write_threads, store, record):
     if not os.path.exists(json_file_path):
         print(f"❌ 跳过：文件不存在 -> {json_file_path}")
-        return
+        return 0
+    record.count('bytes_in', os.path.getsize(json_file_path))
+
+    if stream:
+        return stream_ai_studio_json(json_file_path, output_image_dir, store=store, record=record)
 
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
+        with open(json_file_path, 'r', encoding='utf-8') as f, record.stage('load'):
             data = json.load(f)
     except Exception as e:
         print(f"❌ 读取错误 ({json_file_path}): {e}")
-        return
+        return 0
 
     # 兼容两种结构
     chunks = data.get('chunkedPrompt', {}).get('chunks', [])
@@ -27,12 +426,32 @@ def parse_ai_studio_json(json_file_path, output_image_dir):
 
     if not chunks:
         print(f"⚠️  跳过：{os.path.basename(json_file_path)} (未找到对话数据)")
-        return
+        return 0
 
     print(f"🚀 正在处理: {os.path.basename(json_file_path)}")
     
-    image_count = 0
     safe_basename = os.path.splitext(os.path.basename(json_file_path))[0]
+    writes = deque()  # (文件名, 写盘任务)，按原顺序汇报
+    queued = 0  # 进过 writes 的图片数，用作文件名序号
+    pool = ThreadPoolExecutor(max_workers=write_threads) if write_threads > 1 else None
+    # 最多 2 * write_threads 张解码后的图片等着写盘，内存不随图片数增长
+    max_in_flight = write_threads * 2 if pool else 0
+    image_count = 0
+
+    def report(out_name, job):
+        try:
+            # 线程池模式下这里只统计等待写盘的时间
+            with record.stage('write'):
+                blob, is_new = job.result() if pool and not isinstance(job, tuple) else job
+                if store:
+                    store.link(out_name, blob, json_file_path)
+        except OSError:
+            return 0
+        record.count('images')
+        if not is_new:
+            record.count('duplicates')
+        report_image(out_name, is_new)
+        return 1
 
     for index, chunk in enumerate(chunks):
         # 提取 Base64 图片逻辑
@@ -50,22 +469,66 @@ def parse_ai_studio_json(json_file_path, output_image_dir):
             if b64_str:
                 ext = 'png' if 'png' in mime.lower() else 'jpg'
                 # 文件名：原文件名_img_序号.jpg
-                out_name = f"{safe_basename}_img_{index}_{image_count}.{ext}"
-                out_path = os.path.join(output_image_dir, out_name)
-                
+                out_name = f"{safe_basename}_img_{index}_{queued}.{ext}"
+                payload_digest = None
+                if store:
+                    with record.stage('hash'):
+                        payload_digest = hashlib.sha256(b64_str.encode('utf-8')).hexdigest()
+                        blob = store.lookup(payload_digest)
+                    if blob:
+                        # 以前提取过，不用解码
+                        writes.append((out_name, (blob, False)))
+                        queued += 1
+                        continue
                 try:
-                    with open(out_path, "wb") as f:
-                        f.write(base64.b64decode(b64_str))
-                    print(f"   └── 🖼️  保存图片: {out_name}")
-                    image_count += 1
-                except:
-                    pass
-    
+                    with record.stage('decode'):
+                        image_bytes = base64.b64decode(b64_str)
+                except Exception:
+                    continue
+                record.count('bytes_out', len(image_bytes))
+                out_path = os.path.join(output_image_dir, out_name)
+                if pool:
+                    writes.append((out_name, pool.submit(save_image, out_path, image_bytes, store, payload_digest, ext)))
+                    queued += 1
+                else:
+                    try:
+                        with record.stage('write'):
+                            writes.append((out_name, save_image(out_path, image_bytes, store, payload_digest, ext)))
+                        queued += 1
+                    except OSError:
+                        pass
+                while len(writes) > max_in_flight:
+                    image_count += report(*writes.popleft())
+
+    while writes:
+        image_count += report(*writes.popleft())
+    if pool:
+        pool.shutdown()
+
     if image_count == 0:
         print("   └── (无图片)")
     else:
         print(f"   └── ✅ 提取了 {image_count} 张图片")
     print("-" * 40)
+    return image_count
+
+def extract_file(json_file_path, output_image_dir, stream=False, write_threads=1, dedupe=False, hardlink=False):
+    # 进程池的任务：输出先收集起来，由主进程按文件顺序打印，保证同一文件的输出不被打断
+    store = get_store(output_image_dir, hardlink) if dedupe else None
+    output = StringIO()
+    with redirect_stdout(output):
+        image_count = parse_ai_studio_json(json_file_path, output_image_dir, stream, write_threads, store)
+    return output.getvalue(), image_count
+
+def worker_count(value):
+    """argparse 的 --jobs/--write-threads 类型：大于等于 0 的整数，0 = CPU 核数"""
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"需要整数，收到 '{value}'")
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"不能小于 0，收到 {count}")
+    return count or os.cpu_count() or 1
 
 
 if __name__ == "__main__":
@@ -74,8 +537,17 @@ if __name__ == "__main__":
     # 修改点 1: nargs='+' 表示接收一个或多个文件
     parser.add_argument("files", nargs='+', help="JSON 文件路径，支持通配符如 *.json")
     parser.add_argument("-o", "--output", default="output_images", help="图片保存目录")
+    parser.add_argument("--stream", action="store_true", help="流式解析，适合几百 MB 的大文件，内存占用只有几 MB")
+    parser.add_argument("-j", "--jobs", type=worker_count, default=1, help="同时处理的文件数（进程数，0 = CPU 核数）")
+    parser.add_argument("--write-threads", type=worker_count, default=4, help="每个文件写图片的线程数（0 = CPU 核数）")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="按内容去重：图片存到 blobs/，原文件名写进 manifest.jsonl，重复运行时跳过已提取的图片"
+                             "（--stream 下仍会重新解码，只是不重复存）")
+    parser.add_argument("--hardlink", action="store_true", help="配合 --dedupe，在输出目录按原文件名建硬链接")
+    parser.add_argument("--metrics", metavar="PATH", help="把每个文件各阶段的耗时以 JSON lines 追加写入 PATH（- 表示 stderr）")
 
     args = parser.parse_args()
+    configure_metrics(args.metrics)
 
     # 创建输出目录
     if not os.path.exists(args.output):
@@ -104,7 +576,27 @@ if __name__ == "__main__":
         print(f"📂 图片将保存至: {args.output}")
         print(f"🔍 共找到 {len(all_files)} 个文件，开始处理...\n" + "="*40)
         
-        for file_path in all_files:
-            parse_ai_studio_json(file_path, args.output)
-            
-        print("\n🎉 全部处理完成！")
\ No newline at end of file
+        jobs = args.jobs
+        start = time.perf_counter()
+        total_images = 0
+        dedupe = args.dedupe or args.hardlink
+        if jobs == 1:
+            store = get_store(args.output, args.hardlink) if dedupe else None
+            for file_path in all_files:
+                total_images += parse_ai_studio_json(file_path, args.output, args.stream, args.write_threads, store)
+        else:
+            # 多进程处理，结果按文件顺序打印
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = pool.map(extract_file, all_files, repeat(args.output), repeat(args.stream),
+                                   repeat(args.write_threads), repeat(dedupe), repeat(args.hardlink), chunksize=max(1, len(all_files) // (jobs * 8)))
+                for output, image_count in results:
+                    print(output, end='')
+                    total_images += image_count
+        elapsed = time.perf_counter() - start
+
+        total_mb = sum(os.path.getsize(path) for path in all_files if os.path.isfile(path)) / 1024 / 1024
+        elapsed = elapsed or 1e-9
+        print("\n🎉 全部处理完成！")
+        print(f"⏱️  {len(all_files)} 个文件，{total_images} 张图片，{total_mb:.1f} MB，用时 {elapsed:.2f}s "
+              f"({len(all_files) / elapsed:.1f} 文件/秒，{total_images / elapsed:.1f} 图片/秒，"
+              f"{total_mb / elapsed:.1f} MB/秒，{jobs} 进程)")
\ No newline at end of file
@@ -1,16 +1,145 @@
+import argparse
+import hashlib
+import json
 import os
 import sys
-from PIL import Image, ImageSequence, ImageFilter
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageChops, ImageSequence, ImageFilter
 
-def get_background_color(image, tolerance=0):
-    """Determine the background color of an image."""
+try:
+    import numpy as np
+except ImportError:  # fall back to the pure Python pixel loop
+    np = None
+
+# The shared GIF encoder and metrics live one directory up, in the repository root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gifencoder
+from metrics import Record, configure_metrics
+
+DETECTION_STRATEGIES = ('exact', 'border', 'histogram')
+
+# Edge smoothing kernels; 'box:R' and 'gaussian:R' take a radius in pixels.
+KERNELS = {'smooth': ImageFilter.SMOOTH, 'smooth_more': ImageFilter.SMOOTH_MORE}
+SMOOTH_ITERATIONS = 2
+
+# 5 bits per channel: 32768 histogram bins, few enough for getcolors().
+# Only used when NumPy is missing.
+_HISTOGRAM_LUT = [value & 0xF8 for value in range(256)] * 3
+
+# (content digest, strategy, frame index) -> detected background color, least
+# recently used first. Frame worker threads share it, hence the lock.
+BACKGROUND_CACHE_SIZE = 4096
+_background_cache = OrderedDict()
+_background_cache_lock = threading.Lock()
+
+# Sidecar file written by process_directory(incremental=True).
+MANIFEST_NAME = '.background_remover.json'
+
+def get_background_color(image, tolerance=0, strategy='exact'):
+    """Determine the background color of an image.
+
+    'exact' counts every pixel, 'border' only looks at the outermost rows and
+    columns, and 'histogram' picks the busiest bin of a quantized histogram.
+    """
     image = image.convert("RGB")
+    if strategy == 'border':
+        return _border_color(image)
+    if strategy == 'histogram':
+        return _histogram_color(image)
+    if strategy != 'exact':
+        raise ValueError(f"Unknown detection strategy: {strategy}")
     colors = image.getcolors(image.width * image.height)
     return max(colors, key=lambda x: x[0])[1]
 
+def _border_color(image):
+    """Most common color along the edge of the image."""
+    width, height = image.size
+    strips = [image.crop((0, 0, width, 1))]
+    if height > 1:
+        strips.append(image.crop((0, height - 1, width, height)))
+    if height > 2:
+        strips.append(image.crop((0, 1, 1, height - 1)))
+        strips.append(image.crop((width - 1, 1, width, height - 1)))
+    counts = {}
+    for strip in strips:
+        for count, color in strip.getcolors(strip.width * strip.height):
+            counts[color] = counts.get(color, 0) + count
+    return max(counts.items(), key=lambda x: x[1])[0]
+
+def _histogram_color(image):
+    """Most common color inside the busiest bin of a 5-bit-per-channel histogram."""
+    if np is None:
+        binned = image.point(_HISTOGRAM_LUT)
+        # Ties go to the lowest color, like np.argmax
+        bin_color = min(binned.getcolors(32 ** 3), key=lambda x: (-x[0], x[1]))[1]
+        # Paint pixels outside the bin with a color from another bin, then
+        # count the at most 512 exact colors left inside it
+        difference = ImageChops.difference(binned, Image.new('RGB', image.size, bin_color))
+        outside = difference.getchannel(0)
+        for band in (1, 2):
+            outside = ImageChops.lighter(outside, difference.getchannel(band))
+        other_bin = tuple(channel ^ 0x80 for channel in bin_color)
+        masked = image.copy()
+        masked.paste(other_bin, mask=outside.point(lambda value: 255 if value else 0))
+        colors = [entry for entry in masked.getcolors(513) if entry[1] != other_bin]
+        return min(colors, key=lambda x: (-x[0], x[1]))[1]
+    pixels = np.asarray(image).reshape(-1, 3)
+    high = (pixels >> 3).astype(np.uint16)
+    bins = (high[:, 0] << 10) | (high[:, 1] << 5) | high[:, 2]
+    top = int(np.bincount(bins, minlength=32 ** 3).argmax())
+    # Pixels in the bin only differ in their low 3 bits, so 512 counters suffice.
+    low = (pixels[bins == top] & 0x07).astype(np.uint16)
+    best = int(np.bincount((low[:, 0] << 6) | (low[:, 1] << 3) | low[:, 2], minlength=512).argmax())
+    return tuple(((top >> shift) & 0x1F) << 3 | ((best >> low_shift) & 0x07)
+                 for shift, low_shift in ((10, 6), (5, 3), (0, 0)))
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cached_background_color(image, digest, strategy='exact', frame_index=0):
+    """get_background_color with results cached on the source file's content hash."""
+    if digest is None:
+        return get_background_color(image, strategy=strategy)
+    key = (digest, strategy, frame_index)
+    with _background_cache_lock:
+        color = _background_cache.get(key)
+        if color is not None:
+            _background_cache.move_to_end(key)
+            return color
+    color = get_background_color(image, strategy=strategy)
+    with _background_cache_lock:
+        _background_cache[key] = color
+        while len(_background_cache) > BACKGROUND_CACHE_SIZE:
+            _background_cache.popitem(last=False)
+    return color
+
 def remove_background(image, background_color, tolerance=10):
     """Remove the background from an image."""
     image = image.convert("RGBA")
+    if np is not None:
+        return _remove_background_numpy(image, background_color, tolerance)
+    return _remove_background_python(image, background_color, tolerance)
+
+def _remove_background_numpy(image, background_color, tolerance):
+    """Build the tolerance mask for the whole frame at once with NumPy."""
+    pixels = np.array(image)
+    reference = np.array(background_color[:3], dtype=np.int16)
+    diff = np.abs(pixels[..., :3].astype(np.int16) - reference)
+    mask = (diff <= tolerance).all(axis=-1)
+    pixels[mask] = (255, 255, 255, 0)
+    return Image.fromarray(pixels)
+
+def _remove_background_python(image, background_color, tolerance):
+    """Per-pixel fallback used when NumPy is not installed."""
     data = image.getdata()
     new_data = []
     for item in data:
@@ -21,20 +150,133 @@ def remove_background(image, background_color, tolerance=10):
     image.putdata(new_data)
     return image
 
-def smooth_edges(image, iterations=1):
-    """Smooth the edges of the image to reduce jaggedness."""
+def background_alpha(image, background_color, tolerance=10):
+    """The alpha band remove_background would produce, without building the RGBA result.
+
+    Each color band goes through a 256-entry lookup table, which is much
+    cheaper than comparing every pixel in Python or numpy.
+    """
+    red, green, blue, alpha = image.convert("RGBA").split()
+    mask = None
+    for band, value in zip((red, green, blue), background_color[:3]):
+        table = [255 if abs(level - value) <= tolerance else 0 for level in range(256)]
+        band = band.point(table)
+        mask = band if mask is None else ImageChops.darker(mask, band)
+    return ImageChops.subtract(alpha, mask)
+
+def parse_kernel(kernel):
+    """Turn 'smooth', 'smooth_more', 'box:R' or 'gaussian:R' into an ImageFilter."""
+    name, _, radius = kernel.partition(':')
+    if name in KERNELS and not radius:
+        return KERNELS[name]
+    try:
+        if name == 'box':
+            return ImageFilter.BoxBlur(float(radius))
+        if name == 'gaussian':
+            return ImageFilter.GaussianBlur(float(radius))
+    except ValueError:
+        pass
+    raise ValueError(f"Unknown smoothing kernel: {kernel}")
+
+def smooth_alpha(alpha, kernel='smooth', iterations=SMOOTH_ITERATIONS):
+    """Filter an alpha band `iterations` times with the given kernel."""
+    kernel_filter = parse_kernel(kernel)
     for _ in range(iterations):
-        alpha = image.split()[3]
-        alpha = alpha.filter(ImageFilter.SMOOTH)
+        alpha = alpha.filter(kernel_filter)
+    return alpha
+
+def post_process(image, smooth=True, crop=True, kernel='smooth', bbox=None):
+    """Smooth and crop in one pass that only touches the alpha band.
+
+    bbox replaces the image's own bounding box, so every frame of an
+    animation can be cropped to the same box.
+    """
+    alpha = image.getchannel('A')
+    if smooth:
+        alpha = smooth_alpha(alpha, kernel)
         image.putalpha(alpha)
+    if crop:
+        bbox = bbox or alpha.getbbox()
+        if bbox:
+            image = image.crop(bbox)
     return image
 
-def crop_image(image):
-    """Crop the image to remove excess transparent space."""
-    bbox = image.getbbox()
-    return image.crop(bbox) if bbox else image
+def process_frame(frame, background_color, tolerance=10, crop=True, smooth=True, duration=None,
+                  kernel='smooth', bbox=None):
+    """Run one frame through remove_background and post_process."""
+    processed_frame = remove_background(frame, background_color, tolerance)
+    processed_frame = post_process(processed_frame, smooth, crop, kernel, bbox)
+    if duration is not None:
+        processed_frame.info['duration'] = duration
+    return processed_frame
+
+def map_gif_frames(im, run, workers=1):
+    """Yield run((index, rgba_frame, duration)) for every frame, in order.
+
+    Frames are decoded lazily in chunks of 2 * workers, so memory does not
+    grow with the length of the animation.
+    """
+    chunk_size = max(1, workers) * 2
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def flush(chunk):
+        return executor.map(run, chunk) if executor else map(run, chunk)
+
+    try:
+        chunk = []
+        for index, frame in enumerate(ImageSequence.Iterator(im)):
+            # The iterator seeks one shared image object, so detach each frame first.
+            chunk.append((index, frame.convert("RGBA"), frame.info.get('duration', 100)))
+            if len(chunk) >= chunk_size:
+                yield from flush(chunk)
+                chunk = []
+        if chunk:
+            yield from flush(chunk)
+    finally:
+        if executor:
+            executor.shutdown()
+
+def iter_gif_frames(im, background_color, tolerance=10, crop=True, smooth=True, workers=1,
+                    detect='exact', redetect=False, digest=None, kernel='smooth', bbox=None):
+    """Yield processed GIF frames in order, see map_gif_frames.
+
+    With redetect=True every frame gets its own background color instead of
+    the first frame's. bbox crops every frame to the same box.
+    """
+    def run(item):
+        index, frame, duration = item
+        color = background_color
+        if redetect:
+            color = cached_background_color(frame, digest, detect, index)
+        return process_frame(frame, color, tolerance, crop, smooth, duration, kernel, bbox)
+
+    return map_gif_frames(im, run, workers)
+
+def gif_union_bbox(im, background_color, tolerance=10, smooth=True, workers=1, detect='exact',
+                   redetect=False, digest=None, kernel='smooth'):
+    """Bounding box of what stays visible in any frame, from the alpha band alone.
 
-def process_image(input_path, output_path=None, tolerance=10, crop=True, smooth=True):
+    The frames' alpha bands are folded into one with a per-pixel maximum, so
+    only a single band is kept and smoothed no matter how many frames there are.
+    """
+    def run(item):
+        index, frame, _ = item
+        color = background_color
+        if redetect:
+            color = cached_background_color(frame, digest, detect, index)
+        return background_alpha(frame, color, tolerance)
+
+    visible = None
+    for alpha in map_gif_frames(im, run, workers):
+        visible = alpha if visible is None else ImageChops.lighter(visible, alpha)
+    if visible is None:
+        return None
+    if smooth:
+        visible = smooth_alpha(visible, kernel)
+    return visible.getbbox()
+
+def process_image(input_path, output_path=None, tolerance=10, crop=True, smooth=True, frame_workers=1,
+                  detect='exact', redetect=False, fast_gif=False, kernel='smooth'):
     """Process a single image file."""
     if output_path is None:
         directory, filename = os.path.split(input_path)
@@ -44,78 +286,293 @@ def process_image(input_path, output_path=None, tolerance=10, crop=True, smooth=
         else:
             output_path = os.path.join(directory, f"{name}_transparent.png")
     
+    record = Record('background_remover.process_image', input=input_path)
     try:
+        digest = None
+        if redetect or detect != 'exact':
+            # Only worth a full read when detection is repeated per frame or expensive
+            with record.stage('digest'):
+                digest = file_digest(input_path)
+        record.count('bytes_in', os.path.getsize(input_path))
         with Image.open(input_path) as im:
             if input_path.lower().endswith('.gif'):
-                frames = []
-                durations = []
-                background_color = get_background_color(im.convert("RGB"), tolerance)
-                for frame in ImageSequence.Iterator(im):
-                    processed_frame = remove_background(frame, background_color, tolerance)
-                    if smooth:
-                        processed_frame = smooth_edges(processed_frame, 2)
-                    if crop:
-                        processed_frame = crop_image(processed_frame)
-                    frames.append(processed_frame)
-                    durations.append(frame.info.get('duration', 100))
-                frames[0].save(output_path, save_all=True, append_images=frames[1:], 
-                               loop=0, duration=durations, disposal=2, format="GIF")
-            else:
-                background_color = get_background_color(im, tolerance)
-                processed_image = remove_background(im, background_color, tolerance)
-                if smooth:
-                    processed_image = smooth_edges(processed_image, 2)
+                with record.stage('detect'):
+                    background_color = cached_background_color(im, digest, detect)
+                palette = None
+                if fast_gif:
+                    # Removed pixels turn white, and smoothing leaves some of them
+                    # faintly visible; every other pixel keeps a source color.
+                    # None (too many colors) falls back to a palette per frame.
+                    with record.stage('palette'):
+                        palette = gifencoder.source_palette(im, colors=254)
+                        if palette is not None:
+                            palette += [255, 255, 255]
+                bbox = None
                 if crop:
-                    processed_image = crop_image(processed_image)
-                processed_image.save(output_path, "PNG")
+                    # One box for all frames keeps them aligned and the same size
+                    with record.stage('bbox'):
+                        bbox = gif_union_bbox(im, background_color, tolerance, smooth, frame_workers,
+                                              detect, redetect, digest, kernel)
+                frames = iter_gif_frames(im, background_color, tolerance, crop, smooth, frame_workers,
+                                         detect, redetect, digest, kernel, bbox)
+                frames = record.iter('process', frames, counter='frames')
+                # Each frame carries its own duration and is written as soon as
+                # the generator yields it, so memory does not grow with the GIF.
+                with record.stage('save'):
+                    gifencoder.save_gif(output_path, frames, palette, loop=0, disposal=2)
+            else:
+                with record.stage('detect'):
+                    background_color = cached_background_color(im, digest, detect)
+                with record.stage('process'):
+                    processed_image = process_frame(im, background_color, tolerance, crop, smooth,
+                                                    kernel=kernel)
+                record.count('frames')
+                with record.stage('save'):
+                    processed_image.save(output_path, "PNG")
+        record.count('bytes_out', os.path.getsize(output_path))
+        record.close(output=output_path)
         
         return output_path  # 返回输出文件路径
     except Exception as e:
+        record.close(error=str(e))
         return f"Error: {str(e)}"  # 返回错误信息
 
-def process_directory(directory_path, tolerance=10, crop=True, smooth=True):
-    """Process all supported image files in a directory."""
+def process_directory(directory_path, tolerance=10, crop=True, smooth=True, workers=1,
+                      incremental=False, **options):
+    """Process all supported image files in a directory.
+
+    With workers > 1 the files are spread over a process pool. Results keep
+    the directory listing order either way. With incremental=True, files whose
+    output is still current according to the directory manifest are skipped.
+    Other keyword arguments are passed on to process_image.
+    """
     supported_formats = ('.png', '.jpg', '.jpeg', '.gif')
-    processed_files = []
-    for filename in os.listdir(directory_path):
-        if filename.lower().endswith(supported_formats):
-            input_path = os.path.join(directory_path, filename)
-            result = process_image(input_path, tolerance=tolerance, crop=crop, smooth=smooth)
-            processed_files.append(result)
-    return processed_files
-
-def print_usage():
-    """Print usage instructions."""
-    print("Usage: python background_remover.py <input_path> [tolerance] [nocrop] [nosmooth]")
-    print("  <input_path>: Path to input image or directory")
-    print("  [tolerance]: Optional color tolerance value (default: 10)")
-    print("  [nocrop]: Include this to disable cropping")
-    print("  [nosmooth]: Include this to disable edge smoothing")
-    print("\nSupported image formats: PNG, JPG, JPEG, GIF")
+    input_paths = [os.path.join(directory_path, filename)
+                   for filename in os.listdir(directory_path)
+                   if filename.lower().endswith(supported_formats)]
+    options.update(tolerance=tolerance, crop=crop, smooth=smooth)
+    if incremental:
+        return process_incremental(directory_path, input_paths, workers, **options)
+    if workers <= 1:
+        return [process_image(input_path, **options) for input_path in input_paths]
+    return process_parallel(input_paths, workers, **options)
+
+def process_incremental(directory_path, input_paths, workers=1, **options):
+    """Rebuild only the files whose content or parameters changed since the last run."""
+    entries = load_manifest(directory_path)
+    # Our own outputs live next to the inputs; never feed them back in.
+    outputs = {entry['output'] for entry in entries.values()}
+    input_paths = [path for path in input_paths if os.path.basename(path) not in outputs]
+    params = {'tolerance': options['tolerance'], 'crop': options['crop'], 'smooth': options['smooth'],
+              'detect': options.get('detect', 'exact'), 'redetect': options.get('redetect', False),
+              'fast_gif': options.get('fast_gif', False), 'kernel': options.get('kernel', 'smooth')}
+
+    results = [None] * len(input_paths)
+    stale = []
+    current_entries = {}
+    for index, input_path in enumerate(input_paths):
+        filename = os.path.basename(input_path)
+        entry = entries.get(filename)
+        input_stat = stat_key(input_path)
+        # Unchanged size and mtime: trust the recorded hash instead of re-reading the file.
+        if entry and entry['input_stat'] == input_stat:
+            digest = entry['digest']
+        else:
+            digest = file_digest(input_path)
+        if entry and is_current(entry, directory_path, digest, params):
+            results[index] = os.path.join(directory_path, entry['output'])
+            current_entries[filename] = dict(entry, input_stat=input_stat)
+        else:
+            stale.append((index, input_path, digest, input_stat))
+
+    stale_paths = [input_path for _, input_path, _, _ in stale]
+    if workers <= 1:
+        rebuilt = [process_image(input_path, **options) for input_path in stale_paths]
+    else:
+        rebuilt = process_parallel(stale_paths, workers, **options)
+    for (index, input_path, digest, input_stat), result in zip(stale, rebuilt):
+        results[index] = result
+        if not result.startswith("Error"):
+            current_entries[os.path.basename(input_path)] = {
+                'digest': digest, 'input_stat': input_stat, 'params': params,
+                'output': os.path.basename(result), 'output_stat': stat_key(result)}
+
+    save_manifest(directory_path, current_entries)
+    print(f"Incremental: {len(input_paths) - len(stale)} up to date, {len(stale)} rebuilt")
+    return results
+
+def is_current(entry, directory_path, digest, params):
+    """Check whether a manifest entry still matches the input and its output file."""
+    try:
+        output_stat = stat_key(os.path.join(directory_path, entry['output']))
+    except OSError:
+        return False
+    return (entry['digest'] == digest and entry['params'] == params
+            and entry['output_stat'] == output_stat)
+
+def stat_key(path):
+    """Size and modification time of a file, as stored in the manifest."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def load_manifest(directory_path):
+    """Load the manifest of a directory, or an empty one if it is missing or unreadable."""
+    try:
+        with open(os.path.join(directory_path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+def save_manifest(directory_path, entries):
+    """Atomically replace the manifest of a directory."""
+    manifest_path = os.path.join(directory_path, MANIFEST_NAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'files': entries}, f)
+    os.replace(temp_path, manifest_path)
+
+def process_parallel(input_paths, workers, **options):
+    """Run process_image over a process pool with bounded in-flight work.
+
+    A worker that dies hard (e.g. out of memory) breaks the whole pool and
+    fails every file in flight with it. Those files are retried on a fresh
+    pool, one at a time, so a file is only reported as failed if it breaks
+    a pool on its own.
+    """
+    results = [None] * len(input_paths)
+    fresh = deque(range(len(input_paths)))
+    retry = deque()  # files that were in flight when a pool broke
+    retried = set()
+    pending = {}
+    max_in_flight = workers * 2
+    executor = ProcessPoolExecutor(max_workers=workers)
+    broken = False
+
+    def submit(index):
+        nonlocal executor, broken
+        if broken:
+            executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(max_workers=workers)
+            broken = False
+        try:
+            future = executor.submit(process_image, input_paths[index], **options)
+        except BrokenProcessPool:
+            # The pool died before we saw any of its futures fail
+            executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(max_workers=workers)
+            future = executor.submit(process_image, input_paths[index], **options)
+        pending[future] = index
+
+    try:
+        while fresh or retry or pending:
+            if retry:
+                # Let the broken pool's futures drain, then retry alone
+                if not pending:
+                    submit(retry.popleft())
+            else:
+                while fresh and len(pending) < max_in_flight:
+                    submit(fresh.popleft())
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    if index in retried:
+                        results[index] = f"Error: worker crashed ({str(e)})"
+                    else:
+                        retried.add(index)
+                        retry.append(index)
+                except Exception as e:
+                    results[index] = f"Error: {str(e)}"
+    finally:
+        executor.shutdown()
+    return results
+
+def print_summary(results, elapsed):
+    """Print a throughput summary for a batch run."""
+    errors = sum(1 for result in results if result.startswith("Error"))
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {len(results)} files in {elapsed:.2f}s "
+          f"({rate:.1f} files/s, {errors} errors)")
+
+def worker_count(value):
+    """argparse type for --workers/--frame-workers: an integer >= 0, 0 = one per CPU."""
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a whole number, got '{value}'")
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {count}")
+    return count or os.cpu_count() or 1
+
+def kernel_spec(value):
+    """argparse type for --kernel: checked here, parsed again where it is used."""
+    try:
+        parse_kernel(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Remove the background of an image, or of every image in a directory.",
+        epilog="Supported image formats: PNG, JPG, JPEG, GIF")
+    parser.add_argument("input_path", help="Path to input image or directory")
+    parser.add_argument("flags", nargs='*', metavar="tolerance|nocrop|nosmooth",
+                        help="Color tolerance value (default: 10); nocrop disables cropping; "
+                             "nosmooth disables edge smoothing")
+    parser.add_argument("--workers", type=worker_count, default=1,
+                        help="Process a directory with N processes (0 = one per CPU)")
+    parser.add_argument("--frame-workers", type=worker_count, default=1,
+                        help="Process GIF frames with N threads (0 = one per CPU)")
+    parser.add_argument("--detect", choices=DETECTION_STRATEGIES, default='exact',
+                        help="Background detection strategy (default: exact)")
+    parser.add_argument("--redetect", action="store_true",
+                        help="Detect the background of every GIF frame separately")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip directory files whose output is already up to date")
+    parser.add_argument("--fast-gif", action="store_true",
+                        help="Write GIFs on one shared palette of the source colors "
+                             "(sources with more than 255 colors use a palette per frame)")
+    parser.add_argument("--kernel", type=kernel_spec, default='smooth',
+                        help="Edge smoothing kernel: smooth (default), smooth_more, box:R or gaussian:R")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Append per-file stage timings as JSON lines to PATH ('-' for stderr)")
+    return parser
 
 if __name__ == "__main__":
+    parser = build_parser()
     if len(sys.argv) < 2:
-        print_usage()
-    else:
-        input_path = sys.argv[1]
-        tolerance = 10
-        crop = True
-        smooth = True
-        
-        for arg in sys.argv[2:]:
-            if arg.isdigit():
-                tolerance = int(arg)
-            elif arg.lower() == 'nocrop':
-                crop = False
-            elif arg.lower() == 'nosmooth':
-                smooth = False
-        
-        if os.path.isfile(input_path):
-            result = process_image(input_path, tolerance=tolerance, crop=crop, smooth=smooth)
-            print(result)
-        elif os.path.isdir(input_path):
-            results = process_directory(input_path, tolerance=tolerance, crop=crop, smooth=smooth)
-            for result in results:
-                print(result)
+        # Run without a file (e.g. the .bat opened directly): show the help rather than
+        # parse_intermixed_args' error, which lists the optional flags as required
+        parser.print_help()
+        sys.exit()
+    args = parser.parse_intermixed_args()
+    configure_metrics(args.metrics)
+    input_path = args.input_path
+    options = dict(tolerance=10, crop=True, smooth=True, frame_workers=args.frame_workers,
+                   detect=args.detect, redetect=args.redetect, fast_gif=args.fast_gif, kernel=args.kernel)
+    for flag in args.flags:
+        if flag.isdigit():
+            options['tolerance'] = int(flag)
+        elif flag.lower() == 'nocrop':
+            options['crop'] = False
+        elif flag.lower() == 'nosmooth':
+            options['smooth'] = False
         else:
-            print(f"Error: {input_path} is not a valid file or directory.")
\ No newline at end of file
+            parser.error(f"unknown argument '{flag}'")
+
+    if os.path.isfile(input_path):
+        result = process_image(input_path, **options)
+        print(result)
+    elif os.path.isdir(input_path):
+        start = time.perf_counter()
+        results = process_directory(input_path, workers=args.workers, incremental=args.incremental,
+                                    **options)
+        for result in results:
+            print(result)
+        print_summary(results, time.perf_counter() - start)
+    else:
+        print(f"Error: {input_path} is not a valid file or directory.")